@@ -1,25 +1,46 @@
 from flask import Flask, render_template, request, jsonify, session
-import pandas as pd
 import numpy as np
 import json
-import joblib
 from datetime import datetime, timedelta
-import pickle
+import gc
 import os
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 
-# --- NEW: Import for frequent pattern mining ---
-from mlxtend.frequent_patterns import apriori, association_rules
-# ----------------------------------------------
+from caching import LRUCache, content_key
+from compiled_models import ClusterAssigner, CompiledForest, load_model_bundle, save_model_bundle
+from downsample import downsample_indices, threshold_crossings
+from fit_client import FitnessClientFactory
+from fit_credentials import CredentialCache
+from fit_points import daily_mean, daily_sleep_minutes, daily_sum, extract_point_arrays
+from fit_sync import DailyAggregateStore, local_midnight_nanos, local_timezone_name, nearest_local_date
+from metrics_store import (
+    ROLLUP_GRANULARITIES, MetricsStore, bucket_start_days, columns_to_records, date_to_day, day_to_date,
+    goal_thresholds
+)
+from pattern_items import (
+    DEFAULT_ITEMIZATION, TEMPORAL_ITEMIZATION, fixed_item_count, is_goal_item, item_clause, rules_across_groups,
+    temporal_rules
+)
+from pattern_mining import MAX_ITEMS, association_rules, mask_items, top_rules
+from pattern_state import PatternStateStore
+from recommendation_rules import HotReloadingRuleTable
+from session_store import ServerSideSessionInterface, make_session_backend
+from wire_format import COMPRESSION_MIN_BYTES, choose_content_encoding, compress_body, encode_columnar_dashboard
 
 warnings.filterwarnings('ignore')
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
 
+# Session payloads (history, predictions, patterns) stay on the server; the
+# cookie only carries an opaque session id. SESSION_BACKEND=memory|filesystem
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'filesystem')
+SESSION_DIR = os.environ.get('SESSION_DIR', 'flask_sessions')
+app.session_interface = ServerSideSessionInterface(make_session_backend(SESSION_BACKEND, SESSION_DIR))
+
 # Google Fit API Configuration
 SCOPES = [
     'https://www.googleapis.com/auth/fitness.sleep.read',
@@ -28,39 +49,200 @@ SCOPES = [
     'https://www.googleapis.com/auth/fitness.nutrition.read'
 ]
 
-# Load ML models
-try:
-    kmeans = joblib.load('wellness_clustering_model.pkl')
-    rf_classifier = joblib.load('risk_prediction_model.pkl')
-    # FIX: Load regressor but only use 4 features for it
-    rf_regressor = joblib.load('calorie_prediction_model.pkl')
-    scaler = joblib.load('feature_scaler.pkl')
-    cluster_mapping = joblib.load('cluster_mapping.pkl')
-    models_loaded = True
-    print("✅ ML Models loaded successfully.")
-except Exception as e:
-    models_loaded = False
-    print(f"⚠️ ML Models not loaded: {e}")
+MODEL_FILES = [
+    'wellness_clustering_model.pkl',
+    'risk_prediction_model.pkl',
+    'calorie_prediction_model.pkl',
+    'feature_scaler.pkl',
+    'cluster_mapping.pkl'
+]
+
+def compute_model_version(paths):
+    """Content hash of the model files, so cached predictions never outlive a retrain."""
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+    return content_key(*contents)
+
+# MODEL_LOADING=mmap serves the compiled forests and cluster kernel from .npy arrays
+# mapped read-only, so every worker shares one page-cache copy instead of unpickling
+# its own. The arrays are exported on first start (or after a retrain).
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'pickle')
+MODEL_ARRAYS_DIR = os.environ.get('MODEL_ARRAYS_DIR', 'model_arrays')
+
+kmeans = rf_classifier = rf_regressor = scaler = cluster_mapping = None
+compiled_classifier = None
+compiled_regressor = None
+cluster_assigner = None
+MODEL_VERSION = None
+models_loaded = False
+
+# Models load in a background thread so importing the app stays fast; requests that
+# need them wait on models_ready. MODEL_WARMUP=eager loads them during import instead.
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'background')
+MODEL_WARMUP_TIMEOUT = float(os.environ.get('MODEL_WARMUP_TIMEOUT', 60))
+models_ready = threading.Event()
+model_load_lock = threading.Lock()
+
+def load_models():
+    """Load (or memory-map) the models into the module globals, then set models_ready. Idempotent."""
+    global kmeans, rf_classifier, rf_regressor, scaler, cluster_mapping
+    global compiled_classifier, compiled_regressor, cluster_assigner, MODEL_VERSION, models_loaded
+    with model_load_lock:
+        if models_ready.is_set():
+            return models_loaded
+        try:
+            if MODEL_LOADING == 'mmap':
+                try:
+                    MODEL_VERSION = compute_model_version(MODEL_FILES)
+                    bundle = load_model_bundle(MODEL_ARRAYS_DIR, MODEL_VERSION)
+                    if bundle is not None:
+                        compiled_classifier, compiled_regressor, cluster_assigner = bundle
+                        models_loaded = True
+                        print(f"✅ ML models memory-mapped from {MODEL_ARRAYS_DIR}/{MODEL_VERSION}.")
+                except Exception as e:
+                    print(f"⚠️ Could not map model arrays, loading pickles instead: {e}")
+
+            if not models_loaded:
+                # Load ML models
+                try:
+                    import joblib
+                    kmeans = joblib.load('wellness_clustering_model.pkl')
+                    rf_classifier = joblib.load('risk_prediction_model.pkl')
+                    # FIX: Load regressor but only use 4 features for it
+                    rf_regressor = joblib.load('calorie_prediction_model.pkl')
+                    scaler = joblib.load('feature_scaler.pkl')
+                    cluster_mapping = joblib.load('cluster_mapping.pkl')
+                    models_loaded = True
+                    print("✅ ML Models loaded successfully.")
+                except Exception as e:
+                    models_loaded = False
+                    print(f"⚠️ ML Models not loaded: {e}")
+
+                # Flatten the random forests into contiguous arrays for batched traversal
+                if models_loaded:
+                    try:
+                        compiled_classifier = CompiledForest.from_sklearn(rf_classifier)
+                        compiled_regressor = CompiledForest.from_sklearn(rf_regressor)
+                        print(f"✅ Compiled forests ({compiled_classifier.n_trees} + {compiled_regressor.n_trees} trees).")
+                    except Exception as e:
+                        compiled_classifier = compiled_regressor = None
+                        print(f"⚠️ Falling back to sklearn forest inference: {e}")
+
+                    # Fold the scaler into the KMeans centroids so clustering is one matrix op
+                    try:
+                        cluster_assigner = ClusterAssigner.from_models(scaler, kmeans, cluster_mapping)
+                    except Exception as e:
+                        cluster_assigner = None
+                        print(f"⚠️ Falling back to scaler + KMeans clustering: {e}")
+
+                # Export the compiled arrays, then serve from the mapped copy and let the sklearn objects go
+                if models_loaded and MODEL_LOADING == 'mmap' and None not in (compiled_classifier, compiled_regressor, cluster_assigner):
+                    try:
+                        MODEL_VERSION = MODEL_VERSION or compute_model_version(MODEL_FILES)
+                        save_model_bundle(MODEL_ARRAYS_DIR, MODEL_VERSION, compiled_classifier, compiled_regressor, cluster_assigner)
+                        compiled_classifier, compiled_regressor, cluster_assigner = load_model_bundle(MODEL_ARRAYS_DIR, MODEL_VERSION)
+                        kmeans = rf_classifier = rf_regressor = scaler = cluster_mapping = None
+                        print(f"✅ Exported model arrays to {MODEL_ARRAYS_DIR}/{MODEL_VERSION}.")
+                    except Exception as e:
+                        print(f"⚠️ Could not export model arrays, keeping in-process models: {e}")
+
+            # Per-day predictions are cached under the model version (see run_model_inference)
+            if models_loaded and MODEL_VERSION is None:
+                MODEL_VERSION = compute_model_version(MODEL_FILES)
+        finally:
+            models_ready.set()
+    return models_loaded
+
+def wait_for_models(timeout=None):
+    """Block until warm-up has finished; returns whether the models are usable."""
+    if not models_ready.wait(MODEL_WARMUP_TIMEOUT if timeout is None else timeout):
+        print("⏳ ML models are still warming up.")
+        return False
+    return models_loaded
+
+if MODEL_WARMUP == 'eager':
+    load_models()
+else:
+    threading.Thread(target=load_models, name='model-warmup', daemon=True).start()
+
+def prepare_for_fork():
+    """Finish loading, then freeze everything allocated so far before forking workers (see gunicorn.conf.py).
+
+    gc.freeze moves all current objects into the permanent generation, so the
+    workers' garbage collector never writes to (and copy-on-writes) the pages
+    holding the preloaded module state.
+    """
+    load_models()
+    gc.collect()
+    gc.freeze()
+
+# Per-day predictions keyed by (7-feature vector, model version). Past days rarely
+# change between fetches, so usually only the newest days reach the models.
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+prediction_cache = LRUCache(maxsize=PREDICTION_CACHE_SIZE)
+
+DEFAULT_GOALS = {
+    'steps': 10000,
+    'calories': 2500,
+    'active_minutes': 60,
+    'sleep_hours': 7.5
+}
+
+def get_user_goals():
+    """Current user's goals from the session, or the defaults."""
+    return session.get('user_goals', dict(DEFAULT_GOALS))
+
+# Recommendation rule table; edits to the file are picked up without a restart
+RECOMMENDATION_RULES_PATH = os.environ.get('RECOMMENDATION_RULES', 'recommendation_rules.json')
+recommendation_rules = HotReloadingRuleTable(RECOMMENDATION_RULES_PATH)
+
+# Per-user daily metrics in columnar partitions; the session only keeps the date range
+METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics_store')
+metrics_store = MetricsStore(METRICS_DIR)
+
+MIN_CHART_POINTS = 10
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', 256))
+dashboard_cache = LRUCache(maxsize=DASHBOARD_CACHE_SIZE)
+
+def bump_data_version():
+    """Mark the session's dashboard data as changed (invalidates cached payloads/ETags)."""
+    session['data_version'] = secrets.token_hex(8)
+
+def get_user_id():
+    """Storage key for the current user (Google Fit's \"me\" unless the session says otherwise)."""
+    return session.get('user_id', 'me')
+
+def load_history_columns():
+    """Columns for the session's fetched date range, or None if nothing was fetched yet."""
+    history_range = session.get('history_range')
+    if not history_range:
+        return None
+    columns = metrics_store.read_range(get_user_id(), *history_range)
+    return columns if len(columns['day']) else None
+
+def load_fitness_history():
+    """The session's fetched history as a combined_data-style list of dicts."""
+    columns = load_history_columns()
+    return columns_to_records(columns) if columns is not None else None
+
+# OAuth credentials stay in memory after the first load and are refreshed in the
+# background TOKEN_REFRESH_MARGIN seconds before they expire
+TOKEN_PATH = os.environ.get('GOOGLE_FIT_TOKEN', 'token.pkl')
+TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', 300))
+credential_cache = CredentialCache(TOKEN_PATH, refresh_margin=TOKEN_REFRESH_MARGIN)
 
 def get_google_fit_credentials():
-    creds = None
-    if os.path.exists('token.pkl'):
-        with open('token.pkl', 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception:
-                creds = None
-        if not creds:
-            if os.path.exists('credentials.json'):
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                creds = flow.run_local_server(port=8080)
-                with open('token.pkl', 'wb') as token:
-                    pickle.dump(creds, token)
-            else:
-                return None
+    creds = credential_cache.get()
+    if not creds:
+        if os.path.exists('credentials.json'):
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            creds = flow.run_local_server(port=8080)
+            credential_cache.set(creds)
+        else:
+            return None
     return creds
 
 DATA_SOURCES = {
@@ -73,103 +255,219 @@ DATA_SOURCES = {
     "sleep": "derived:com.google.sleep.segment:com.google.android.gms:merged"
 }
 
-def fetch_google_fit_data(days=7):
-    """Fetch and process raw data from Google Fit for the specified number of days."""
+def process_summed_metric(points, value_key='intVal'):
+    """Processes metrics that should be summed daily."""
+    if not points: return {}
+    times, values = extract_point_arrays(points, value_key)
+    return daily_sum(times, values)
+
+def process_averaged_metric(points, value_key='fpVal'):
+    """Processes metrics that should be averaged daily."""
+    if not points: return {}
+    times, values = extract_point_arrays(points, value_key)
+    return daily_mean(times, values)
+
+def process_sleep(points):
+    """Processes sleep segments into total daily sleep duration."""
+    if not points: return {}
+    return daily_sleep_minutes(points)
+
+# How each source is reduced to one value per day: (reduction, value key)
+METRIC_AGGREGATION = {
+    "steps": ("sum", "intVal"),
+    "calories": ("sum", "fpVal"),
+    "active_minutes": ("sum", "intVal"),
+    "heart_minutes": ("sum", "fpVal"),
+    "weight": ("mean", "fpVal"),
+    "height": ("mean", "fpVal"),
+    "sleep": ("sleep", "intVal")
+}
+
+def request_raw_points(service, http, metric, start_nanos, end_nanos):
+    """Raw point-level dataset for one source (dataSources.datasets.get)."""
+    return service.users().dataSources().datasets().get(
+        userId="me",
+        dataSourceId=DATA_SOURCES[metric],
+        datasetId=f"{start_nanos}-{end_nanos}"
+    ).execute(http=http)
+
+def parse_raw_points(metric, dataset):
+    """Bucket a raw dataset response into {date: value} on the client."""
+    points = dataset.get("point", [])
+    reduction, value_key = METRIC_AGGREGATION[metric]
+    if reduction == "sleep":
+        return process_sleep(points)
+    if reduction == "mean":
+        return process_averaged_metric(points, value_key)
+    return process_summed_metric(points, value_key)
+
+# Daily buckets follow local calendar days in this zone, so a DST change gives a
+# 23- or 25-hour bucket instead of shifting every later bucket by an hour
+FIT_TIMEZONE = os.environ.get('FIT_TIMEZONE') or local_timezone_name()
+
+def daily_bucket_spec():
+    if FIT_TIMEZONE:
+        return {"period": {"type": "day", "value": 1, "timeZoneId": FIT_TIMEZONE}}
+    # Zone unknown: fixed 24h buckets, labelled by their nearest local midnight when parsed
+    return {"durationMillis": 86400000}
+
+def request_daily_buckets(service, http, metric, start_nanos, end_nanos):
+    """Server-side daily buckets for one source (dataset.aggregate with bucketByTime)."""
+    # Buckets are laid out from the start time, so start at local midnight
+    start_day = datetime.fromtimestamp(start_nanos / 1e9).date()
+    return service.users().dataset().aggregate(
+        userId="me",
+        body={
+            "aggregateBy": [{"dataSourceId": DATA_SOURCES[metric]}],
+            "bucketByTime": daily_bucket_spec(),
+            "startTimeMillis": local_midnight_nanos(start_day) // 1_000_000,
+            "endTimeMillis": end_nanos // 1_000_000
+        }
+    ).execute(http=http)
+
+def parse_daily_buckets(metric, response):
+    """Turn an aggregate response into {date: value}, rounded like the raw path."""
+    reduction, value_key = METRIC_AGGREGATION[metric]
+    daily = {}
+    for bucket in response.get("bucket", []):
+        values = []
+        for dataset in bucket.get("dataset", []):
+            for point in dataset.get("point", []):
+                val = point.get("value", [{}])[0].get(value_key)
+                if val is not None:
+                    values.append(float(val))
+        if not values:
+            continue
+        date_str = nearest_local_date(int(bucket["startTimeMillis"]) * 1_000_000).strftime('%Y-%m-%d')
+        if reduction == "mean":
+            daily[date_str] = round(sum(values) / len(values), 2)
+        else:
+            daily[date_str] = round(sum(values))
+    return daily
+
+# Fetch strategies: (request, parse) pairs that both produce {date: value} per source.
+# Sleep segments always use the raw path; daily buckets would lose segment stages.
+FETCH_STRATEGIES = {
+    "raw": (request_raw_points, parse_raw_points),
+    "aggregate": (request_daily_buckets, parse_daily_buckets)
+}
+# Windows at least this long default to server-side aggregation
+AGGREGATE_FETCH_MIN_DAYS = int(os.environ.get('AGGREGATE_FETCH_MIN_DAYS', 14))
+
+def resolve_fetch_strategy(metric, strategy):
+    if metric == "sleep" or strategy not in FETCH_STRATEGIES:
+        return "raw"
+    return strategy
+
+def fetch_daily_metric(service, http, metric, start_nanos, end_nanos, strategy="raw"):
+    """Fetch one source with the given strategy and return {date: value}."""
+    request_fn, parse_fn = FETCH_STRATEGIES[resolve_fetch_strategy(metric, strategy)]
+    return parse_fn(metric, request_fn(service, http, metric, start_nanos, end_nanos))
+
+# Upper bound on concurrent Google Fit dataset requests per fetch
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', len(DATA_SOURCES)))
+
+# Incremental sync: daily aggregates persist in SQLite, and each source is only
+# re-fetched from its high-water mark minus a re-check window for late data
+SYNC_DB_PATH = os.environ.get('FIT_SYNC_DB', 'fit_sync.sqlite3')
+SYNC_RECHECK_DAYS = int(os.environ.get('FIT_SYNC_RECHECK_DAYS', 2))
+aggregate_store = None
+
+# Fitness v1 service objects are built from the bundled discovery document once per
+# credential, and authorized HTTP clients are pooled so their connections stay open
+FITNESS_DISCOVERY_PATH = os.environ.get('FITNESS_DISCOVERY', 'fitness_v1_discovery.json')
+FIT_HTTP_POOL_SIZE = int(os.environ.get('FIT_HTTP_POOL_SIZE', len(DATA_SOURCES)))
+fitness_clients = FitnessClientFactory(FITNESS_DISCOVERY_PATH, max_idle=FIT_HTTP_POOL_SIZE)
+
+def get_aggregate_store():
+    global aggregate_store
+    if aggregate_store is None:
+        aggregate_store = DailyAggregateStore(SYNC_DB_PATH)
+    return aggregate_store
+
+def fetch_google_fit_data(days=7, max_workers=None, incremental=False, strategy=None):
+    """Fetch and process raw data from Google Fit for the specified number of days.
+
+    strategy is "raw" (point-level datasets bucketed locally) or "aggregate"
+    (daily buckets computed by Google Fit); by default windows of
+    AGGREGATE_FETCH_MIN_DAYS or more use "aggregate". With incremental=True only
+    data newer than each source's last sync (plus SYNC_RECHECK_DAYS) is
+    requested; older days come from the aggregate store.
+    """
     print(f"\n=== FETCHING RAW DATA FROM GOOGLE FIT API (LAST {days} DAYS) ===")
     creds = get_google_fit_credentials()
     if not creds:
         print("❌ Failed to get Google Fit credentials")
         return None
 
-    service = build("fitness", "v1", credentials=creds)
+    if strategy is None:
+        strategy = "aggregate" if days >= AGGREGATE_FETCH_MIN_DAYS else "raw"
+
+    service = fitness_clients.service(creds)
 
     now_utc = datetime.utcnow()
     start_time = now_utc - timedelta(days=days)
     end_nanos = int(now_utc.timestamp() * 1e9)
     start_nanos = int(start_time.timestamp() * 1e9)
 
-    print(f"📅 Fetching data from {start_time.date()} to {now_utc.date()}")
+    print(f"📅 Fetching data from {start_time.date()} to {now_utc.date()} ({strategy} mode)")
 
-    def fetch_raw_data(data_source_id, metric_name):
-        """Fetches raw, point-in-time data for a given source."""
-        print(f"  📊 Fetching raw {metric_name}...")
+    if incremental:
+        store = get_aggregate_store()
+        fetch_ranges = {
+            metric: store.sync_ranges(metric, start_time, end_nanos, SYNC_RECHECK_DAYS) for metric in DATA_SOURCES
+        }
+    else:
+        fetch_ranges = {metric: [(start_nanos, end_nanos)] for metric in DATA_SOURCES}
+
+    def fetch_daily_data(metric_name):
+        """Fetches one source's ranges as [((from, to), daily values)]. Returns None on failure."""
+        ranges = fetch_ranges[metric_name]
+        if ranges != [(start_nanos, end_nanos)]:
+            spans = ", ".join(
+                f"{datetime.fromtimestamp(lo / 1e9).date()}..{datetime.fromtimestamp((hi - 1) / 1e9).date()}"
+                for lo, hi in ranges
+            )
+            print(f"  📊 Fetching {metric_name} ({spans})...")
+        else:
+            print(f"  📊 Fetching {metric_name}...")
         try:
-            dataset = service.users().dataSources().datasets().get(
-                userId="me",
-                dataSourceId=data_source_id,
-                datasetId=f"{start_nanos}-{end_nanos}"
-            ).execute()
-            points = dataset.get("point", [])
-            print(f"    ✅ Got {len(points)} raw data points for {metric_name}")
-            return points
+            # httplib2 connections aren't thread-safe, so each request checks one out of the pool
+            with fitness_clients.http(creds) as http:
+                results = [
+                    ((lo, hi), fetch_daily_metric(service, http, metric_name, lo, hi, strategy)) for lo, hi in ranges
+                ]
+            print(f"    ✅ Got {sum(len(values) for _, values in results)} days of {metric_name}")
+            return results
         except Exception as e:
-            print(f"    ❌ Error fetching raw {metric_name}: {e}")
-            return []
+            print(f"    ❌ Error fetching {metric_name}: {e}")
+            return None
 
-    raw_data = {metric: fetch_raw_data(source, metric) for metric, source in DATA_SOURCES.items()}
+    # Issue all dataset requests concurrently; wall-clock time tracks the slowest source
+    workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(DATA_SOURCES)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {metric: executor.submit(fetch_daily_data, metric) for metric in DATA_SOURCES}
+        fetched = {metric: future.result() for metric, future in futures.items()}
 
     print("\n📈 Processing and combining daily data...")
 
-    def process_summed_metric(points, value_key='intVal'):
-        """Processes metrics that should be summed daily."""
-        if not points: return {}
-        data_list = []
-        for p in points:
-            val = p.get("value", [{}])[0].get(value_key)
-            if val is not None:
-                data_list.append({
-                    "time": datetime.fromtimestamp(int(p["startTimeNanos"]) / 1e9),
-                    "value": float(val)
-                })
-        
-        if not data_list: return {}
-        df = pd.DataFrame(data_list)
-        df['date'] = df['time'].dt.strftime('%Y-%m-%d')
-        return df.groupby('date')['value'].sum().round().to_dict()
-
-    def process_averaged_metric(points, value_key='fpVal'):
-        """Processes metrics that should be averaged daily."""
-        if not points: return {}
-        data_list = []
-        for p in points:
-            val = p.get("value", [{}])[0].get(value_key)
-            if val is not None:
-                data_list.append({
-                    "time": datetime.fromtimestamp(int(p["startTimeNanos"]) / 1e9),
-                    "value": float(val)
-                })
-        
-        if not data_list: return {}
-        df = pd.DataFrame(data_list)
-        df['date'] = df['time'].dt.strftime('%Y-%m-%d')
-        return df.groupby('date')['value'].mean().round(2).to_dict()
-    
-    def process_sleep(points):
-        """Processes sleep segments into total daily sleep duration."""
-        if not points: return {}
-        sleep_stages = [2, 4, 5, 6]
-        data_list = []
-        for p in points:
-            stage = p.get("value", [{}])[0].get("intVal")
-            if stage in sleep_stages:
-                data_list.append({
-                    "start": datetime.fromtimestamp(int(p["startTimeNanos"]) / 1e9),
-                    "end": datetime.fromtimestamp(int(p["endTimeNanos"]) / 1e9)
-                })
-        
-        if not data_list: return {}
-        df = pd.DataFrame(data_list)
-        df['duration_minutes'] = (df['end'] - df['start']).dt.total_seconds() / 60
-        df['date'] = df['end'].dt.strftime('%Y-%m-%d')
-        return df.groupby('date')['duration_minutes'].sum().round().to_dict()
-
-    daily_steps = process_summed_metric(raw_data["steps"])
-    daily_calories = process_summed_metric(raw_data["calories"], 'fpVal')
-    daily_active_minutes = process_summed_metric(raw_data["active_minutes"])
-    daily_heart_minutes = process_summed_metric(raw_data["heart_minutes"], 'fpVal')
-    daily_weight = process_averaged_metric(raw_data["weight"])
-    daily_height = process_averaged_metric(raw_data["height"])
-    daily_sleep = process_sleep(raw_data["sleep"])
+    if incremental:
+        # Fresh days replace stored ones; sources that failed keep their old days and marks
+        for metric, results in fetched.items():
+            for (lo, hi), daily_values in results or []:
+                store.replace_days(metric, daily_values, lo, hi)
+        window_start_date = start_time.strftime('%Y-%m-%d')
+        daily = {metric: store.load_days(metric, window_start_date) for metric in DATA_SOURCES}
+    else:
+        daily = {metric: dict(results[0][1]) if results else {} for metric, results in fetched.items()}
+
+    daily_steps = daily["steps"]
+    daily_calories = daily["calories"]
+    daily_active_minutes = daily["active_minutes"]
+    daily_heart_minutes = daily["heart_minutes"]
+    daily_weight = daily["weight"]
+    daily_height = daily["height"]
+    daily_sleep = daily["sleep"]
 
     all_dates = set(daily_steps.keys()) | set(daily_calories.keys()) | set(daily_active_minutes.keys()) | set(daily_sleep.keys())
     if not all_dates:
@@ -202,62 +500,118 @@ def fetch_google_fit_data(days=7):
     print(f"✅ Successfully processed {len(combined_data)} days of Google Fit data.")
     return combined_data
 
-def generate_ml_predictions(fitness_data):
-    if not models_loaded or not fitness_data:
+def build_feature_row(record):
+    """Derive the 7 model features (steps ... activity_intensity) for one fitness record."""
+    total_active_minutes = max(1, record.get('active_minutes', 0))
+    very_active_minutes = min(total_active_minutes, record.get('steps', 0) // 120)
+    step_calorie_ratio = record.get('steps', 0) / max(record.get('calories', 1), 1)
+    activity_intensity = very_active_minutes / max(total_active_minutes, 1)
+
+    row = [
+        record.get('steps', 0),
+        total_active_minutes,
+        very_active_minutes,
+        record.get('calories', 1600),
+        record.get('bmi', 24.0),
+        step_calorie_ratio,
+        activity_intensity
+    ]
+    row = [float(value) for value in row]
+    if not np.all(np.isfinite(row)):
+        raise ValueError(f"non-finite feature value in {row}")
+    return row
+
+def score_feature_matrix(features_full):
+    """Run each model once over an (n, 7) feature matrix.
+
+    Returns (wellness_categories, risk_probs, predicted_calories) arrays of
+    length n. The calorie regressor only uses the first 4 columns (steps,
+    active_minutes, very_active_minutes, calories).
+    """
+    if cluster_assigner is not None:
+        wellness_categories = cluster_assigner.labels(features_full)
+    else:
+        clusters = kmeans.predict(scaler.transform(features_full))
+        wellness_categories = np.array([cluster_mapping.get(c, 'Healthy') for c in clusters], dtype=object)
+    if compiled_classifier is not None and compiled_regressor is not None:
+        risk_probs = compiled_classifier.predict_proba(features_full)[:, 1]
+        predicted_calories = compiled_regressor.predict(features_full[:, :4])
+    else:
+        risk_probs = rf_classifier.predict_proba(features_full)[:, 1]
+        predicted_calories = rf_regressor.predict(features_full[:, :4])
+    return wellness_categories, risk_probs, predicted_calories
+
+def score_records_batched(features_full):
+    """Score a feature matrix in one pass, falling back to row-by-row scoring on failure.
+
+    Returns (wellness_categories, risk_probs, predicted_calories, ok) where
+    ok[i] is False for rows that could not be scored, so one bad row never
+    drops the batch.
+    """
+    n = len(features_full)
+    try:
+        wellness_categories, risk_probs, predicted_calories = score_feature_matrix(features_full)
+        return wellness_categories, risk_probs, predicted_calories, np.ones(n, dtype=bool)
+    except Exception as e:
+        print(f"⚠️ Batched inference failed ({e}), falling back to per-record scoring.")
+
+    wellness_categories = np.full(n, 'Healthy', dtype=object)
+    risk_probs = np.zeros(n)
+    predicted_calories = np.zeros(n)
+    ok = np.zeros(n, dtype=bool)
+    for i in range(n):
+        try:
+            c, r, p = score_feature_matrix(features_full[i:i + 1])
+            wellness_categories[i], risk_probs[i], predicted_calories[i] = c[0], r[0], p[0]
+            ok[i] = True
+        except Exception as e:
+            print(f"❌ Error during prediction for row {i}: {e}")
+    return wellness_categories, risk_probs, predicted_calories, ok
+
+def run_model_inference(fitness_data):
+    """Goal-independent model outputs (wellness category, risk, predicted calories) per record."""
+    if not fitness_data or not wait_for_models():
         return []
-    print("\n🤖 Generating ML predictions...")
-    predictions = []
-    
+
+    # Build the whole feature matrix up front; rows that can't be featurized are skipped
+    valid_records = []
+    rows = []
     for record in fitness_data:
         try:
-            # Get user goals for personalized recommendations
-            goals = session.get('user_goals', {
-                'steps': 10000,
-                'calories': 2500,
-                'active_minutes': 60,
-                'sleep_hours': 7.5
-            })
-            
-            total_active_minutes = max(1, record.get('active_minutes', 0))
-            very_active_minutes = min(total_active_minutes, record.get('steps', 0) // 120)
-            step_calorie_ratio = record.get('steps', 0) / max(record.get('calories', 1), 1)
-            activity_intensity = very_active_minutes / max(total_active_minutes, 1)
-
-            # FIX: Use 7 features for clustering and classification
-            features_full = np.array([[
-                record.get('steps', 0), 
-                total_active_minutes, 
-                very_active_minutes,
-                record.get('calories', 1600), 
-                record.get('bmi', 24.0),
-                step_calorie_ratio, 
-                activity_intensity
-            ]])
-            features_scaled = scaler.transform(features_full)
-            
-            # Use all 7 features for clustering and classification
-            cluster = kmeans.predict(features_scaled)[0]
-            wellness_category = cluster_mapping.get(cluster, 'Healthy')
-            risk_prob = rf_classifier.predict_proba(features_full)[0][1]
-            
-            # FIX: Use only first 4 features for calorie prediction (steps, active_minutes, very_active_minutes, calories)
-            features_regressor = np.array([[
-                record.get('steps', 0), 
-                total_active_minutes, 
-                very_active_minutes,
-                record.get('calories', 1600)
-            ]])
-            predicted_calories = rf_regressor.predict(features_regressor)[0]
-            
-            recommendations = generate_personalized_recommendations(record, wellness_category, risk_prob > 0.5, goals)
-
-            predictions.append({
+            rows.append(build_feature_row(record))
+            valid_records.append(record)
+        except Exception as e:
+            print(f"❌ Error during prediction for {record.get('date')}: {e}")
+
+    if not rows:
+        return []
+
+    features_full = np.array(rows, dtype=float)
+
+    # Only rows whose feature vector hasn't been scored by this model version hit the models
+    keys = [content_key(row.tobytes(), MODEL_VERSION) for row in features_full]
+    scores = [prediction_cache.get(key) for key in keys]
+    misses = [i for i, score in enumerate(scores) if score is None]
+    if misses:
+        wellness_categories, risk_probs, predicted_calories, ok = score_records_batched(features_full[misses])
+        for j, i in enumerate(misses):
+            if ok[j]:
+                scores[i] = (str(wellness_categories[j]), float(risk_probs[j]), int(predicted_calories[j]))
+                prediction_cache.put(keys[i], scores[i])
+    print(f"  🗃️ Prediction cache: {len(rows) - len(misses)} hits, {len(misses)} misses")
+
+    model_outputs = []
+    for record, score in zip(valid_records, scores):
+        if score is None:
+            continue
+        try:
+            wellness_category, risk_prob, predicted_calories = score
+            model_outputs.append({
                 'date': record['date'],
                 'wellness_category': wellness_category,
-                'risk_probability': float(risk_prob),
+                'risk_probability': risk_prob,
                 'is_at_risk': bool(risk_prob > 0.5),
-                'predicted_calories': int(predicted_calories),
-                'recommendations': recommendations,
+                'predicted_calories': predicted_calories,
                 'actual_steps': record.get('steps', 0),
                 'actual_calories': record.get('calories', 0),
                 'active_minutes': record.get('active_minutes', 0),
@@ -265,122 +619,170 @@ def generate_ml_predictions(fitness_data):
                 'bmi': record.get('bmi', 0)
             })
         except Exception as e:
-            print(f"❌ Error during prediction for {record['date']}: {e}")
+            print(f"❌ Error during prediction for {record.get('date')}: {e}")
             continue
-    
+    return model_outputs
+
+def attach_recommendations(model_outputs, goals):
+    """Add goal-dependent recommendation strings to model outputs. No model calls."""
+    # Each output already carries the actual metrics the recommendations look at
+    records = [
+        {
+            'steps': output.get('actual_steps', 0),
+            'calories': output.get('actual_calories', 0),
+            'active_minutes': output.get('active_minutes', 0),
+            'sleep_minutes': output.get('sleep_minutes', 0)
+        }
+        for output in model_outputs
+    ]
+    recommendations = recommendation_rules.evaluate(
+        records,
+        [output['wellness_category'] for output in model_outputs],
+        [output['risk_probability'] > 0.5 for output in model_outputs],
+        goals
+    )
+    return [{**output, 'recommendations': text} for output, text in zip(model_outputs, recommendations)]
+
+def generate_ml_predictions(fitness_data, goals=None):
+    if not fitness_data or not wait_for_models():
+        return []
+    print("\n🤖 Generating ML predictions...")
+
+    # Get user goals for personalized recommendations
+    if goals is None:
+        goals = get_user_goals()
+
+    predictions = attach_recommendations(run_model_inference(fitness_data), goals)
     print(f"✅ Generated {len(predictions)} ML predictions.")
     return predictions
 
 # --- NEW: Function for Frequent Pattern Mining ---
 # In app_with_api.py
 
-def find_wellness_patterns(fitness_data, goals):
+# Item vocabulary (see pattern_items.DEFAULT_ITEMIZATION) and bounds on mining work
+PATTERN_ITEMIZATION = DEFAULT_ITEMIZATION
+PATTERN_MIN_SUPPORT = 0.2
+PATTERN_MIN_LIFT = 1.1
+PATTERN_MAX_LEN = int(os.environ.get('PATTERN_MAX_LEN', 3))
+PATTERN_TOP_K = int(os.environ.get('PATTERN_TOP_K', 10))
+# "daily" mines each day on its own; "temporal" mines rules from earlier days to today
+PATTERN_MODES = tuple(os.environ.get('PATTERN_MODES', 'daily,temporal').split(','))
+PATTERN_TEMPORAL_ITEMIZATION = TEMPORAL_ITEMIZATION
+PATTERN_TEMPORAL_WINDOW = int(os.environ.get('PATTERN_TEMPORAL_WINDOW', 2))
+# Every item is repeated once per day in the window, and itemsets are MAX_ITEMS-bit masks
+PATTERN_TEMPORAL_MAX_WINDOW = MAX_ITEMS // fixed_item_count(PATTERN_TEMPORAL_ITEMIZATION)
+if 'temporal' in PATTERN_MODES and PATTERN_TEMPORAL_WINDOW > PATTERN_TEMPORAL_MAX_WINDOW >= 2:
+    print(f"⚠️ PATTERN_TEMPORAL_WINDOW={PATTERN_TEMPORAL_WINDOW} exceeds {MAX_ITEMS} items, "
+          f"using {PATTERN_TEMPORAL_MAX_WINDOW} days")
+    PATTERN_TEMPORAL_WINDOW = PATTERN_TEMPORAL_MAX_WINDOW
+elif 'temporal' in PATTERN_MODES and not 2 <= PATTERN_TEMPORAL_WINDOW <= PATTERN_TEMPORAL_MAX_WINDOW:
+    print(f"⚠️ PATTERN_TEMPORAL_WINDOW={PATTERN_TEMPORAL_WINDOW} can't be mined, disabling temporal patterns")
+    PATTERN_MODES = tuple(mode for mode in PATTERN_MODES if mode != 'temporal')
+# Itemset counts per user and mode, updated day by day instead of re-mined
+PATTERN_STATE_DIR = os.environ.get('PATTERN_STATE_DIR', 'pattern_state')
+pattern_states = PatternStateStore(PATTERN_STATE_DIR)
+# Finished insight lists, keyed by history content, goal thresholds and mining parameters
+PATTERN_CACHE_SIZE = int(os.environ.get('PATTERN_CACHE_SIZE', 128))
+pattern_cache = LRUCache(maxsize=PATTERN_CACHE_SIZE)
+
+def format_pattern_insight(antecedent, consequent, confidence, item_names):
+    items = [item_names[i] for i in mask_items(antecedent | consequent)]
+    if all(is_goal_item(name) for name in items):
+        names = lambda mask: ", ".join(item_names[i] for i in mask_items(mask)).replace('_', ' ')
+        return f"💡 **Pattern Found!** When you achieve your **{names(antecedent)}**, you are **{confidence:.0%} likely** to also achieve your **{names(consequent)}**."
+    clauses = lambda mask: " and ".join(item_clause(item_names[i]) for i in mask_items(mask))
+    return f"💡 **Pattern Found!** When **{clauses(antecedent)}**, **{clauses(consequent)}** **{confidence:.0%} of the time**."
+
+def mine_pattern_rules(mode, fitness_data, goals, predictions):
+    """(item names, frequent itemsets, rules) for one mining mode, from the user's incremental pattern state."""
+    if mode == 'temporal':
+        config, window = PATTERN_TEMPORAL_ITEMIZATION, PATTERN_TEMPORAL_WINDOW
+    else:
+        config, window = PATTERN_ITEMIZATION, 1
+    itemsets, item_names, item_groups, lags = pattern_states.mine(
+        get_user_id(), mode, fitness_data, predictions, goals, config, PATTERN_MIN_SUPPORT,
+        window=window, max_len=PATTERN_MAX_LEN
+    )
+    print(f"--- {mode.upper()} PATTERN MINING OVER {len(item_names)} ITEMS ---")
+    # Rules that only restate one metric (High Steps -> Met Step Goal) aren't insights
+    rules = rules_across_groups(association_rules(itemsets, min_lift=PATTERN_MIN_LIFT), item_groups)
+    if window > 1:
+        rules = temporal_rules(rules, lags)
+    return item_names, itemsets, rules
+
+def mine_wellness_patterns(fitness_data, goals, predictions=None):
+    """Mine insight strings for every mode in PATTERN_MODES. Uncached; raises on errors."""
+    print("\n🔍 Finding wellness patterns...")
+    # (item names, itemsets, rules) per mode
+    mined = [mine_pattern_rules(mode, fitness_data, goals, predictions)
+             for mode in ('daily', 'temporal') if mode in PATTERN_MODES]
+
+    n_itemsets = sum(len(itemsets) for _, itemsets, _ in mined)
+    if not n_itemsets:
+        # --- DEBUG: Print if no frequent itemsets are found ---
+        print("⚠️ No frequent itemsets found with current support level.")
+        return ["Not enough consistent patterns found yet. Keep up your activities!"]
+
+    # --- DEBUG: Print how many frequent itemsets were found ---
+    print(f"\n--- {n_itemsets} FREQUENT ITEMSETS FOUND ---")
+    # --------------------------------------------------------
+
+    # Each rule carries the item names of the mode it came from
+    rules = [rule + (item_names,) for item_names, _, mode_rules in mined for rule in mode_rules]
+    if not rules:
+        # --- DEBUG: Print if no association rules are found ---
+        print("⚠️ No strong association rules found with current lift level.")
+        return ["Found some frequent activities, but no strong connections between them yet."]
+
+    # --- DEBUG: Print the rules that were found ---
+    print(f"\n--- {len(rules)} ASSOCIATION RULES FOUND ---")
+    # ----------------------------------------------
+
+    insights = [
+        format_pattern_insight(antecedent, consequent, confidence, item_names)
+        for antecedent, consequent, _, confidence, _, item_names in top_rules(rules, PATTERN_TOP_K)
+    ]
+
+    print(f"✅ Found {len(insights)} wellness patterns.")
+    return insights if insights else ["No strong wellness patterns discovered yet. Keep logging your data!"]
+
+def pattern_cache_key(fitness_data, goals, predictions):
+    """Content key over the history, the goal thresholds it is itemized with, and the mining parameters."""
+    history = json.dumps(fitness_data, sort_keys=True, default=str)
+    # Only category and risk feed the item vocabulary, not the recommendation text
+    prediction_items = json.dumps(
+        [(p['date'], p['wellness_category'], bool(p['is_at_risk'])) for p in predictions or []]
+    )
+    params = json.dumps([
+        PATTERN_ITEMIZATION, PATTERN_TEMPORAL_ITEMIZATION, PATTERN_MODES, PATTERN_TEMPORAL_WINDOW,
+        PATTERN_MIN_SUPPORT, PATTERN_MIN_LIFT, PATTERN_MAX_LEN, PATTERN_TOP_K
+    ], sort_keys=True)
+    return content_key(get_user_id(), history, prediction_items, goal_thresholds(goals).tobytes(), params)
+
+def find_wellness_patterns(fitness_data, goals, predictions=None):
     """Analyzes historical data to find frequent patterns and insights."""
     if not fitness_data or len(fitness_data) < 3:
         return []
 
-    print("\n🔍 Finding wellness patterns...")
-    df = pd.DataFrame(fitness_data)
-    
-    df['Met_Step_Goal'] = df['steps'] >= goals.get('steps', 10000)
-    df['Met_Calorie_Goal'] = df['calories'] >= goals.get('calories', 2500)
-    df['Met_Active_Goal'] = df['active_minutes'] >= goals.get('active_minutes', 60)
-    df['Good_Sleep'] = df['sleep_minutes'] >= (goals.get('sleep_hours', 7.5) * 60 * 0.9)
-    
-    transactions = df[['Met_Step_Goal', 'Met_Calorie_Goal', 'Met_Active_Goal', 'Good_Sleep']]
-    
-    # --- DEBUG: Print the transaction data ---
-    print("--- TRANSACTIONS FOR PATTERN MINING ---")
-    print(transactions)
-    # -----------------------------------------
-    
-    try:
-        frequent_itemsets = apriori(transactions, min_support=0.2, use_colnames=True) # Using 0.2
-        if frequent_itemsets.empty:
-            # --- DEBUG: Print if no frequent itemsets are found ---
-            print("⚠️ No frequent itemsets found with current support level.")
-            return ["Not enough consistent patterns found yet. Keep up your activities!"]
-
-        # --- DEBUG: Print the frequent itemsets that were found ---
-        print("\n--- FREQUENT ITEMSETS FOUND ---")
-        print(frequent_itemsets)
-        # --------------------------------------------------------
-
-        rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1.1)
-        if rules.empty:
-            # --- DEBUG: Print if no association rules are found ---
-            print("⚠️ No strong association rules found with current lift level.")
-            return ["Found some frequent activities, but no strong connections between them yet."]
-
-        # --- DEBUG: Print the rules that were found ---
-        print("\n--- ASSOCIATION RULES FOUND ---")
-        print(rules[['antecedents', 'consequents', 'lift', 'confidence']])
-        # ----------------------------------------------
-            
-        insights = []
-        for index, rule in rules.iterrows():
-            antecedents = ", ".join(list(rule['antecedents'])).replace('_', ' ')
-            consequents = ", ".join(list(rule['consequents'])).replace('_', ' ')
-            confidence = rule['confidence']
-            
-            insight = f"💡 **Pattern Found!** When you achieve your **{antecedents}**, you are **{confidence:.0%} likely** to also achieve your **{consequents}**."
-            insights.append(insight)
-        
-        print(f"✅ Found {len(insights)} wellness patterns.")
-        return insights if insights else ["No strong wellness patterns discovered yet. Keep logging your data!"]
+    # Refetching unchanged data or switching back to an earlier goal set skips mining entirely
+    cache_key = pattern_cache_key(fitness_data, goals, predictions)
+    cached = pattern_cache.get(cache_key)
+    if cached is not None:
+        print(f"🗃️ Pattern cache hit: {len(cached)} wellness patterns.")
+        return list(cached)
 
+    try:
+        insights = mine_wellness_patterns(fitness_data, goals, predictions)
     except Exception as e:
         print(f"❌ Error during pattern finding: {e}")
         return ["Could not analyze wellness patterns due to an error."]
+    pattern_cache.put(cache_key, tuple(insights))
+    return insights
 
 
 def generate_personalized_recommendations(record, wellness_category, is_at_risk, goals):
     """Generate personalized recommendations based on user goals"""
-    recs = []
-    
-    steps = record.get('steps', 0)
-    active_mins = record.get('active_minutes', 0)
-    sleep_mins = record.get('sleep_minutes', 0)
-    calories = record.get('calories', 0)
-    
-    step_goal = goals.get('steps', 10000)
-    active_goal = goals.get('active_minutes', 60)
-    sleep_goal = goals.get('sleep_hours', 7.5) * 60
-    calorie_goal = goals.get('calories', 2500)
-    
-    # Steps recommendations
-    if steps < step_goal * 0.5:
-        recs.append(f"🚶‍♂️ You're at {int(steps/step_goal*100)}% of your step goal. Try to reach {int(step_goal*0.7)} steps today")
-    elif steps < step_goal:
-        recs.append(f"📈 Almost there! Just {step_goal - steps} more steps to reach your goal")
-    elif steps >= step_goal:
-        recs.append(f"🎉 Goal achieved! You've completed {int(steps/step_goal*100)}% of your step target")
-    
-    # Activity recommendations
-    if active_mins < active_goal * 0.5:
-        recs.append(f"⏰ Try to get {int(active_goal*0.7)}+ active minutes today")
-    elif active_mins >= active_goal:
-        recs.append(f"💪 Great job! You hit your active minutes goal")
-    
-    # Sleep recommendations
-    if sleep_mins < sleep_goal * 0.8:
-        recs.append(f"😴 Try to get at least {sleep_goal/60:.1f} hours of sleep tonight")
-    elif sleep_mins >= sleep_goal:
-        recs.append(f"🌙 Well rested! You got {sleep_mins/60:.1f} hours of quality sleep")
-    
-    # Calories recommendations
-    if calories < calorie_goal * 0.7:
-        recs.append(f"🔥 Increase activity to burn more calories (Goal: {calorie_goal})")
-    elif calories >= calorie_goal:
-        recs.append(f"🔥 Excellent! You burned {int(calories/calorie_goal*100)}% of your calorie goal")
-    
-    # Wellness category specific
-    if wellness_category == 'At Risk' or is_at_risk:
-        recs.append("⚠️ Focus on improving your activity levels this week")
-    elif wellness_category == 'High Performance':
-        recs.append("🏆 Outstanding performance! Remember to include rest days")
-    
-    return " | ".join(recs) if recs else "Keep up your current routine!"
+    return recommendation_rules.evaluate([record], [wellness_category], [is_at_risk], goals)[0]
 
 
 @app.route('/')
@@ -392,25 +794,29 @@ def fetch_fitness_data_endpoint():
     print("\n=== API ENDPOINT: /api/fetch-fitness-data ===")
     try:
         days = int(request.args.get('days', 7))
-        fitness_data = fetch_google_fit_data(days)
+        # ?sync=full forces a complete re-download of the window
+        incremental = request.args.get('sync', 'incremental') != 'full'
+        # ?strategy=raw|aggregate overrides the window-length default
+        strategy = request.args.get('strategy')
+        if strategy not in FETCH_STRATEGIES:
+            strategy = None
+        fitness_data = fetch_google_fit_data(days, incremental=incremental, strategy=strategy)
         if not fitness_data:
             return jsonify({'status': 'error', 'message': f'No activity data found in Google Fit for the last {days} days.'})
         
         predictions = generate_ml_predictions(fitness_data)
         
         # --- NEW: Find wellness patterns and save to session ---
-        user_goals = session.get('user_goals', {
-            'steps': 10000,
-            'calories': 2500,
-            'active_minutes': 60,
-            'sleep_hours': 7.5
-        })
-        patterns = find_wellness_patterns(fitness_data, user_goals)
+        user_goals = get_user_goals()
+        patterns = find_wellness_patterns(fitness_data, user_goals, predictions)
         session['wellness_patterns'] = patterns
         # ----------------------------------------------------
         
-        session['fitness_data'] = fitness_data
+        metrics_store.set_goals(get_user_id(), user_goals)
+        metrics_store.append(get_user_id(), fitness_data)
+        session['history_range'] = [fitness_data[0]['date'], fitness_data[-1]['date']]
         session['predictions'] = predictions
+        bump_data_version()
         
         return jsonify({
             'status': 'success', 
@@ -421,66 +827,216 @@ def fetch_fitness_data_endpoint():
         print(f"❌ Error in API endpoint: {e}")
         return jsonify({'status': 'error', 'message': f'An internal error occurred: {str(e)}'})
 
-@app.route('/api/dashboard-data')
-def get_dashboard_data():
-    fitness_data = session.get('fitness_data')
+def downsample_chart_series(columns, sleep_hours, predictions, goals, max_points):
+    """Per-series LTTB row selections for the dashboard charts.
+
+    Goal threshold crossings and at-risk days are pinned so they are never dropped.
+    """
+    row_by_day = {day: i for i, day in enumerate(columns['day'].tolist())}
+    at_risk_rows = [
+        row_by_day[date_to_day(p['date'])] for p in predictions or []
+        if p.get('is_at_risk') and date_to_day(p['date']) in row_by_day
+    ]
+    series = {
+        'steps': (columns['steps'], goals.get('steps', 10000)),
+        'calories': (columns['calories'], goals.get('calories', 2500)),
+        'active_minutes': (columns['active_minutes'], goals.get('active_minutes', 60)),
+        'sleep_hours': (sleep_hours, goals.get('sleep_hours', 7.5)),
+        'bmi': (columns['bmi'], None)
+    }
+
+    rows = {}
+    for name, (values, goal) in series.items():
+        keep = list(at_risk_rows)
+        if goal is not None:
+            keep.extend(threshold_crossings(values, goal).tolist())
+        rows[name] = downsample_indices(columns['day'], values, max_points, keep).tolist()
+    return {'max_points': max_points, 'rows': rows}
+
+def rollup_summary(columns, rollup, granularity):
+    """Summary totals from rollup buckets fully inside the window, plus the partial edge days."""
+    days = columns['day']
+    starts = bucket_start_days(rollup['bucket'], granularity)
+    ends = bucket_start_days(rollup['bucket'] + 1, granularity)
+    inside = (starts >= days[0]) & (ends <= days[-1] + 1)
+
+    # Days of the window not covered by whole buckets (at most one bucket at each end)
+    covered_lo = starts[inside][0] if inside.any() else days[-1] + 1
+    covered_hi = ends[inside][-1] if inside.any() else days[-1] + 1
+    edge = (days < covered_lo) | (days >= covered_hi)
+
+    total_days = int(rollup['count'][inside].sum() + edge.sum())
+    total_steps = int(rollup['steps_sum'][inside].sum() + columns['steps'][edge].sum())
+    total_calories = int(rollup['calories_sum'][inside].sum() + columns['calories'][edge].sum())
+    total_sleep = float(rollup['sleep_minutes_sum'][inside].sum() + columns['sleep_minutes'][edge].sum())
+    max_steps = max(rollup['steps_max'][inside].max(initial=0), columns['steps'][edge].max(initial=0))
+    no_min = np.iinfo(np.int64).max
+    min_steps = min(rollup['steps_min'][inside].min(initial=no_min), columns['steps'][edge].min(initial=no_min))
+
+    return {
+        'total_days': total_days,
+        'avg_steps': int(total_steps / total_days) if total_days > 0 else 0,
+        'avg_calories': int(total_calories / total_days) if total_days > 0 else 0,
+        'avg_sleep': round(total_sleep / total_days / 60, 1) if total_days > 0 else 0,
+        'wellness_score': 0,
+        'total_steps': total_steps,
+        'total_calories': total_calories,
+        'max_steps': int(max_steps) if total_days > 0 else 0,
+        'min_steps': int(min_steps) if total_days > 0 else 0
+    }
+
+def rollup_chart_data(rollup, granularity):
+    """Per-bucket chart series: daily means per metric, days per bucket and goal-hit counts."""
+    count = rollup['count']
+    per_day = np.maximum(count, 1)
+    return {
+        'granularity': granularity,
+        'dates': [day_to_date(day) for day in bucket_start_days(rollup['bucket'], granularity)],
+        'days': count.tolist(),
+        'steps': np.round(rollup['steps_sum'] / per_day, 1).tolist(),
+        'calories': np.round(rollup['calories_sum'] / per_day, 1).tolist(),
+        'active_minutes': np.round(rollup['active_minutes_sum'] / per_day, 1).tolist(),
+        'sleep_hours': np.round(rollup['sleep_minutes_sum'] / per_day / 60, 2).tolist(),
+        'bmi': np.round(rollup['bmi_sum'] / per_day, 2).tolist(),
+        'goal_hits': {
+            name: rollup[f'{name}_hits'].tolist()
+            for name in ('steps', 'calories', 'active_minutes', 'sleep_minutes')
+        }
+    }
+
+def build_dashboard_payload(fmt='legacy', max_points=None, granularity='day'):
+    """Compute the /api/dashboard-data payload, or None if nothing has been fetched.
+
+    fmt='columnar' returns the compact version-3 wire format (see wire_format.py).
+    With max_points, a 'downsampled' entry lists the rows each chart series should
+    plot (see downsample_chart_series). granularity='week'|'month' charts the
+    incrementally maintained rollups instead of days and takes the summary from them.
+    """
+    # Columns come straight from the metrics store, already typed
+    columns = load_history_columns()
     predictions = session.get('predictions')
     # --- NEW: Get wellness patterns from session ---
     patterns = session.get('wellness_patterns', [])
     # ---------------------------------------------
 
-    if not fitness_data:
-        return jsonify({'error': 'No fitness data in session. Please fetch data first.'})
+    if columns is None:
+        return None
 
-    df = pd.DataFrame(fitness_data)
-    pred_df = pd.DataFrame(predictions) if predictions else pd.DataFrame()
-    
-    # Ensure proper data types
-    df['steps'] = pd.to_numeric(df['steps'], errors='coerce').fillna(0).astype(int)
-    df['calories'] = pd.to_numeric(df['calories'], errors='coerce').fillna(0).astype(int)
-    df['active_minutes'] = pd.to_numeric(df['active_minutes'], errors='coerce').fillna(0).astype(int)
-    df['sleep_minutes'] = pd.to_numeric(df['sleep_minutes'], errors='coerce').fillna(0).astype(int)
-    df['sleep_hours'] = df['sleep_minutes'] / 60
-    
-    print(f"📊 Creating dashboard data for {len(df)} days.")
+    steps = columns['steps']
+    calories = columns['calories']
+    sleep_hours = columns['sleep_minutes'] / 60
+    n_days = len(steps)
+
+    print(f"📊 Creating dashboard data for {n_days} days.")
+
+    rollup = None
+    if granularity in ROLLUP_GRANULARITIES:
+        rollup = metrics_store.read_rollup(get_user_id(), granularity, *session['history_range'])
 
     # Summary Stats
-    summary_stats = {
-        'total_days': len(df),
-        'avg_steps': int(df['steps'].mean()) if len(df) > 0 else 0,
-        'avg_calories': int(df['calories'].mean()) if len(df) > 0 else 0,
-        'avg_sleep': round(df['sleep_hours'].mean(), 1) if len(df) > 0 else 0,
-        'wellness_score': 0,
-        'total_steps': int(df['steps'].sum()),
-        'total_calories': int(df['calories'].sum()),
-        'max_steps': int(df['steps'].max()) if len(df) > 0 else 0,
-        'min_steps': int(df['steps'].min()) if len(df) > 0 else 0
-    }
+    if rollup is not None:
+        summary_stats = rollup_summary(columns, rollup, granularity)
+    else:
+        summary_stats = {
+            'total_days': n_days,
+            'avg_steps': int(steps.mean()) if n_days > 0 else 0,
+            'avg_calories': int(calories.mean()) if n_days > 0 else 0,
+            'avg_sleep': round(sleep_hours.mean(), 1) if n_days > 0 else 0,
+            'wellness_score': 0,
+            'total_steps': int(steps.sum()),
+            'total_calories': int(calories.sum()),
+            'max_steps': int(steps.max()) if n_days > 0 else 0,
+            'min_steps': int(steps.min()) if n_days > 0 else 0
+        }
     
     # Calculate wellness score (percentage of days meeting goals)
     if predictions:
         healthy_days = len([p for p in predictions if not p.get('is_at_risk')])
         summary_stats['wellness_score'] = int((healthy_days / len(predictions)) * 100) if predictions else 0
 
+    downsampled = None
+    if rollup is None and max_points and n_days > max_points:
+        downsampled = downsample_chart_series(columns, sleep_hours, predictions, get_user_goals(), max_points)
+
+    if fmt == 'columnar':
+        payload = encode_columnar_dashboard(
+            columns, predictions, summary_stats, patterns, recommendation_rules.current().separator
+        )
+        if downsampled:
+            payload['downsampled'] = downsampled
+        if rollup is not None:
+            payload['rollup'] = rollup_chart_data(rollup, granularity)
+        return payload
+
     # Prepare chart data (send raw data, let frontend create charts)
     chart_data = {
-        'dates': df['date'].tolist(),
-        'steps': df['steps'].tolist(),
-        'calories': df['calories'].tolist(),
-        'active_minutes': df['active_minutes'].tolist(),
-        'sleep_hours': df['sleep_hours'].tolist(),
-        'bmi': df['bmi'].tolist()
+        'dates': [day_to_date(day) for day in columns['day']],
+        'steps': steps.tolist(),
+        'calories': calories.tolist(),
+        'active_minutes': columns['active_minutes'].tolist(),
+        'sleep_hours': sleep_hours.tolist(),
+        'bmi': columns['bmi'].tolist()
     }
+    if downsampled:
+        chart_data['downsampled'] = downsampled
+    if rollup is not None:
+        chart_data = rollup_chart_data(rollup, granularity)
 
-    return jsonify({
+    return {
         'chart_data': chart_data,
         'predictions': predictions,
         'summary': summary_stats,
-        'raw_data': fitness_data,
+        'raw_data': columns_to_records(columns),
         # --- NEW: Add wellness patterns to the response ---
         'wellness_patterns': patterns
         # ------------------------------------------------
-    })
+    }
+
+@app.route('/api/dashboard-data')
+def get_dashboard_data():
+    # ?format=columnar selects the compact wire format; default stays the legacy shape
+    fmt = 'columnar' if request.args.get('format') == 'columnar' else 'legacy'
+    # ?max_points=N downsamples long chart series (LTTB) on the server
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points < MIN_CHART_POINTS:
+        max_points = MIN_CHART_POINTS
+    # ?granularity=week|month charts weekly/monthly rollups instead of days
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ROLLUP_GRANULARITIES:
+        granularity = 'day'
+
+    # Serialized payloads are cached per (user, data version, format, max_points);
+    # the version changes whenever a fetch or goal change rewrites the session data
+    data_version = session.get('data_version')
+    cache_key = content_key(get_user_id(), data_version, fmt, str(max_points), granularity) if data_version else None
+    representations = dashboard_cache.get(cache_key) if cache_key else None
+
+    if representations is None:
+        payload = build_dashboard_payload(fmt, max_points, granularity)
+        if payload is None:
+            return jsonify({'error': 'No fitness data in session. Please fetch data first.'})
+        body = app.json.dumps(payload).encode('utf-8')
+        representations = {'identity': (content_key(body), body)}
+        if cache_key:
+            dashboard_cache.put(cache_key, representations)
+
+    # Compressed bodies are cached next to the plain one, each with its own strong ETag
+    etag, body = representations['identity']
+    encoding = choose_content_encoding(request.accept_encodings) if len(body) >= COMPRESSION_MIN_BYTES else None
+    if encoding:
+        if encoding not in representations:
+            representations[encoding] = (f"{etag}-{encoding}", compress_body(body, encoding))
+        etag, body = representations[encoding]
+
+    response = app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # Let browsers keep the payload but revalidate it on every load
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/api/set-goals', methods=['POST'])
 def set_goals():
@@ -493,29 +1049,49 @@ def set_goals():
             'sleep_hours': float(goals.get('sleep_hours', 7.5))
         }
         
-        # Regenerate predictions with new goals
-        fitness_data = session.get('fitness_data')
+        metrics_store.set_goals(get_user_id(), session['user_goals'])
+
+        # Only the recommendations depend on goals, so re-derive them from the
+        # stored model outputs instead of re-running the models
+        fitness_data = load_fitness_history()
         if fitness_data:
-            predictions = generate_ml_predictions(fitness_data)
+            predictions = attach_recommendations(session.get('predictions') or [], session['user_goals'])
             session['predictions'] = predictions
 
             # --- NEW: Regenerate patterns with new goals ---
-            patterns = find_wellness_patterns(fitness_data, session['user_goals'])
+            patterns = find_wellness_patterns(fitness_data, session['user_goals'], predictions)
             session['wellness_patterns'] = patterns
             # -----------------------------------------------
+            bump_data_version()
 
         return jsonify({'status': 'success', 'message': 'Goals saved successfully!'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    return jsonify({
+        'prediction_cache': prediction_cache.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'pattern_cache': pattern_cache.stats(),
+        'fitness_clients': fitness_clients.stats(),
+        'credentials': credential_cache.stats(),
+        'model_version': MODEL_VERSION
+    })
+
+@app.route('/api/ready')
+def get_ready():
+    """Readiness probe: 503 until model warm-up has finished."""
+    ready = models_ready.is_set()
+    return jsonify({
+        'ready': ready,
+        'models_loaded': models_loaded,
+        'model_version': MODEL_VERSION
+    }), 200 if ready else 503
+
 @app.route('/api/get-goals')
 def get_goals():
-    goals = session.get('user_goals', {
-        'steps': 10000,
-        'calories': 2500,
-        'active_minutes': 60,
-        'sleep_hours': 7.5
-    })
+    goals = get_user_goals()
     return jsonify(goals)
 
 if __name__ == '__main__':
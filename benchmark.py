@@ -0,0 +1,742 @@
+"""Parity checks and latency benchmarks for the wellness inference paths.
+
+Usage:
+    python benchmark.py forest [--rows 1 7 30 365] [--repeat 20]
+    python benchmark.py cluster [--rows 1 7 30 365] [--repeat 20]
+    python benchmark.py models [--rows 365] [--repeat 5]
+    python benchmark.py fetch [--days 365] [--repeat 5]    (needs Google Fit credentials)
+    python benchmark.py clients [--requests 100] [--threads 8]
+    python benchmark.py credentials [--seconds 5] [--latency-ms 200]
+    python benchmark.py payload [--days 365]
+    python benchmark.py patterns [--days 30 365 1825] [--items 4 12 24 56] [--max-len 3] [--windows 2 3] [--repeat 5]
+    python benchmark.py recommendations [--rows 1 7 30 365 5000] [--repeat 20]
+    python benchmark.py imports [--budget-ms 1500] [--output importtime.log] [--top 15] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import joblib
+import numpy as np
+
+from compiled_models import ClusterAssigner, CompiledForest
+from pattern_items import DEFAULT_ITEMIZATION, TEMPORAL_ITEMIZATION, itemize, lagged_items, rules_across_groups, temporal_rules
+from pattern_mining import association_rules, fp_growth, frequent_itemsets, mask_items, pack_transactions
+from pattern_state import PatternState
+from recommendation_rules import RuleTable
+
+
+def make_feature_matrix(n, seed=0):
+    """Synthesize n plausible 7-column feature rows (same derivation as build_feature_row)."""
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(0, 25000, n)
+    active_minutes = np.maximum(1, rng.integers(0, 180, n))
+    very_active = np.minimum(active_minutes, steps // 120)
+    calories = rng.integers(1200, 4000, n)
+    bmi = np.round(rng.uniform(17.0, 35.0, n), 2)
+    step_calorie_ratio = steps / np.maximum(calories, 1)
+    activity_intensity = very_active / np.maximum(active_minutes, 1)
+    return np.column_stack([
+        steps, active_minutes, very_active, calories, bmi, step_calorie_ratio, activity_intensity
+    ]).astype(float)
+
+
+def make_fitness_records(n, seed=0):
+    """Synthesize n consecutive days in the combined_data schema, ending today."""
+    rng = np.random.default_rng(seed)
+    today = datetime.now().date()
+    records = []
+    for i in range(n):
+        steps = int(rng.integers(0, 25000))
+        weight = round(float(rng.uniform(55.0, 95.0)), 1)
+        height = 1.75
+        records.append({
+            "date": (today - timedelta(days=n - 1 - i)).strftime('%Y-%m-%d'),
+            "steps": steps,
+            "calories": int(rng.integers(1200, 4000)),
+            "active_minutes": int(rng.integers(0, 180)),
+            "heart_minutes": int(rng.integers(0, 90)),
+            "sleep_minutes": int(rng.integers(240, 600)),
+            "weight": weight,
+            "height": height,
+            "bmi": round(weight / (height ** 2), 2)
+        })
+    return records
+
+
+def time_call(fn, repeat):
+    """Best-of-N wall time of fn() in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_forest(args):
+    """Check CompiledForest parity with the pickled forests and compare latency."""
+    rf_classifier = joblib.load('risk_prediction_model.pkl')
+    rf_regressor = joblib.load('calorie_prediction_model.pkl')
+
+    start = time.perf_counter()
+    compiled_classifier = CompiledForest.from_sklearn(rf_classifier)
+    compiled_regressor = CompiledForest.from_sklearn(rf_regressor)
+    print(f"🔧 Compiled {compiled_classifier.n_trees} + {compiled_regressor.n_trees} trees "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    failures = 0
+    print(f"\n{'rows':>6} {'sklearn proba':>14} {'compiled':>10} {'sklearn reg':>12} {'compiled':>10}")
+    for n in args.rows:
+        X = make_feature_matrix(n, seed=n)
+        X_reg = X[:, :4]
+
+        proba_ok = np.array_equal(compiled_classifier.predict_proba(X), rf_classifier.predict_proba(X))
+        reg_ok = np.array_equal(compiled_regressor.predict(X_reg), rf_regressor.predict(X_reg))
+        if not (proba_ok and reg_ok):
+            failures += 1
+            print(f"❌ Parity mismatch at {n} rows (predict_proba={proba_ok}, predict={reg_ok})")
+
+        timings = [
+            time_call(lambda: rf_classifier.predict_proba(X), args.repeat),
+            time_call(lambda: compiled_classifier.predict_proba(X), args.repeat),
+            time_call(lambda: rf_regressor.predict(X_reg), args.repeat),
+            time_call(lambda: compiled_regressor.predict(X_reg), args.repeat),
+        ]
+        print(f"{n:>6} {timings[0]:>11.2f} ms {timings[1]:>7.2f} ms {timings[2]:>9.2f} ms {timings[3]:>7.2f} ms")
+
+    if failures:
+        print("\n❌ Compiled forests do not match the pickled models.")
+        return 1
+    print("\n✅ Compiled forests match predict_proba/predict exactly.")
+    return 0
+
+
+def bench_cluster(args):
+    """Check the fused ClusterAssigner against scaler -> KMeans -> cluster_mapping."""
+    kmeans = joblib.load('wellness_clustering_model.pkl')
+    scaler = joblib.load('feature_scaler.pkl')
+    cluster_mapping = joblib.load('cluster_mapping.pkl')
+    assigner = ClusterAssigner.from_models(scaler, kmeans, cluster_mapping)
+
+    def reference(X):
+        clusters = kmeans.predict(scaler.transform(X))
+        return np.array([cluster_mapping.get(c, 'Healthy') for c in clusters], dtype=object)
+
+    failures = 0
+    print(f"\n{'rows':>6} {'scaler+kmeans':>14} {'fused':>10}")
+    for n in args.rows:
+        X = make_feature_matrix(n, seed=n)
+        mismatches = int(np.sum(assigner.labels(X) != reference(X)))
+        if mismatches:
+            failures += 1
+            print(f"❌ {mismatches} of {n} rows labelled differently")
+
+        timings = [
+            time_call(lambda: reference(X), args.repeat),
+            time_call(lambda: assigner.labels(X), args.repeat),
+        ]
+        print(f"{n:>6} {timings[0]:>11.2f} ms {timings[1]:>7.2f} ms")
+
+    if failures:
+        print("\n❌ Fused cluster kernel does not match scaler + KMeans.")
+        return 1
+    print("\n✅ Fused cluster kernel matches scaler + KMeans + cluster_mapping.")
+    return 0
+
+
+def bench_models(args):
+    """Compare unpickle + compile startup with memory-mapping an exported bundle, and check parity."""
+    import tempfile
+
+    from compiled_models import load_model_bundle, save_model_bundle
+
+    def load_pickled():
+        scaler = joblib.load('feature_scaler.pkl')
+        kmeans = joblib.load('wellness_clustering_model.pkl')
+        cluster_mapping = joblib.load('cluster_mapping.pkl')
+        return (
+            CompiledForest.from_sklearn(joblib.load('risk_prediction_model.pkl')),
+            CompiledForest.from_sklearn(joblib.load('calorie_prediction_model.pkl')),
+            ClusterAssigner.from_models(scaler, kmeans, cluster_mapping),
+        )
+
+    pickled_ms = time_call(load_pickled, args.repeat)
+    classifier, regressor, assigner = load_pickled()
+    with tempfile.TemporaryDirectory() as directory:
+        save_model_bundle(directory, 'benchmark', classifier, regressor, assigner)
+        mapped_ms = time_call(lambda: load_model_bundle(directory, 'benchmark'), args.repeat)
+        mapped_classifier, mapped_regressor, mapped_assigner = load_model_bundle(directory, 'benchmark')
+
+        X = make_feature_matrix(args.rows, seed=args.rows)
+        same = (
+            np.array_equal(mapped_classifier.predict_proba(X), classifier.predict_proba(X))
+            and np.array_equal(mapped_regressor.predict(X[:, :4]), regressor.predict(X[:, :4]))
+            and np.array_equal(mapped_assigner.labels(X), assigner.labels(X))
+        )
+
+    print(f"\n{'unpickle + compile':>20} {pickled_ms:>8.1f} ms")
+    print(f"{'mmap bundle':>20} {mapped_ms:>8.1f} ms")
+    if not same:
+        print("\n❌ Memory-mapped models differ from the in-process compiled models.")
+        return 1
+    print(f"\n✅ Memory-mapped models match the in-process compiled models on {args.rows} rows.")
+    return 0
+
+
+def bench_fetch(args):
+    """Compare payload bytes and parse time of the raw and aggregate fetch strategies."""
+    import app_with_api as app
+
+    creds = app.get_google_fit_credentials()
+    if not creds:
+        print("❌ Google Fit credentials are required for the fetch benchmark.")
+        return 1
+    service = app.fitness_clients.service(creds)
+
+    now = datetime.now()
+    end_nanos = int(now.timestamp() * 1e9)
+    start_nanos = int((now - timedelta(days=args.days)).timestamp() * 1e9)
+
+    print(f"\n{'metric':<16} {'strategy':<10} {'bytes':>10} {'request':>10} {'parse':>10} {'days':>6}")
+    totals = {name: [0, 0.0, 0.0] for name in app.FETCH_STRATEGIES}
+    for metric in app.DATA_SOURCES:
+        for name in app.FETCH_STRATEGIES:
+            if app.resolve_fetch_strategy(metric, name) != name:
+                continue
+            request_fn, parse_fn = app.FETCH_STRATEGIES[name]
+            start = time.perf_counter()
+            with app.fitness_clients.http(creds) as http:
+                response = request_fn(service, http, metric, start_nanos, end_nanos)
+            request_ms = (time.perf_counter() - start) * 1000
+            payload_bytes = len(json.dumps(response).encode('utf-8'))
+            parse_ms = time_call(lambda: parse_fn(metric, response), args.repeat)
+            days = len(parse_fn(metric, response))
+
+            totals[name][0] += payload_bytes
+            totals[name][1] += request_ms
+            totals[name][2] += parse_ms
+            print(f"{metric:<16} {name:<10} {payload_bytes:>10} {request_ms:>7.1f} ms {parse_ms:>7.2f} ms {days:>6}")
+
+    print()
+    for name, (payload_bytes, request_ms, parse_ms) in totals.items():
+        print(f"{'TOTAL':<16} {name:<10} {payload_bytes:>10} {request_ms:>7.1f} ms {parse_ms:>7.2f} ms")
+    return 0
+
+
+def bench_clients(args):
+    """Per-request Google Fit client setup: build() + new AuthorizedHttp vs. the shared FitnessClientFactory."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    import google_auth_httplib2
+    import httplib2
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+
+    from fit_client import FitnessClientFactory
+
+    # No request is sent, so anonymous credentials are enough
+    creds = AnonymousCredentials()
+    factory = FitnessClientFactory(args.discovery)
+
+    def per_request_build():
+        service = build("fitness", "v1", credentials=creds)
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+        return service.users().dataset().aggregate(userId="me", body={}), http
+
+    def shared_factory():
+        service = factory.service(creds)
+        with factory.http(creds) as http:
+            return service.users().dataset().aggregate(userId="me", body={}), http
+
+    first_start = time.perf_counter()
+    shared_factory()
+    first_ms = (time.perf_counter() - first_start) * 1000
+    build_ms = time_call(per_request_build, args.requests)
+    factory_ms = time_call(shared_factory, args.requests)
+
+    # Concurrent requests must share one service object and reuse pooled clients
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(lambda _: shared_factory(), range(args.requests)))
+    stats = factory.stats()
+
+    print(f"\n{'per-request build()':>24} {build_ms:>8.3f} ms")
+    print(f"{'factory (first call)':>24} {first_ms:>8.3f} ms")
+    print(f"{'factory (per request)':>24} {factory_ms:>8.3f} ms")
+    print(f"\n{stats['service_builds']} service build(s), {stats['http_clients']} HTTP client(s) "
+          f"for {2 * args.requests + 1} requests on up to {args.threads} threads")
+    if stats['service_builds'] != 1 or stats['http_clients'] > args.threads:
+        print("\n❌ The factory rebuilt the service or leaked HTTP clients.")
+        return 1
+    print("\n✅ One service object and at most one pooled HTTP client per thread.")
+    return 0
+
+
+def legacy_credentials(token_path):
+    """The original get_google_fit_credentials: unpickle token.pkl, refresh synchronously if expired."""
+    import pickle
+
+    from google.auth.transport.requests import Request
+
+    with open(token_path, 'rb') as token:
+        creds = pickle.load(token)
+    if not creds.valid and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+    return creds
+
+
+def bench_credentials(args):
+    """Credential lookup latency, legacy vs. CredentialCache, against a local fake OAuth token endpoint."""
+    import pickle
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from google.oauth2.credentials import Credentials
+
+    from fit_credentials import CredentialCache
+
+    issued = []
+
+    class TokenEndpoint(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(args.latency_ms / 1000)
+            issued.append(f"token-{len(issued) + 1}")
+            body = json.dumps({'access_token': issued[-1], 'expires_in': args.lifetime, 'token_type': 'Bearer'})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TokenEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def make_credentials(expires_in):
+        return Credentials(
+            token='token-0', refresh_token='refresh', client_id='client', client_secret='secret',
+            token_uri=f"http://127.0.0.1:{server.server_port}/token",
+            expiry=datetime.utcnow() + timedelta(seconds=expires_in)
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        token_path = os.path.join(directory, 'token.pkl')
+
+        with open(token_path, 'wb') as f:
+            pickle.dump(make_credentials(args.lifetime), f)
+        legacy_valid_ms = time_call(lambda: legacy_credentials(token_path), args.repeat)
+        with open(token_path, 'wb') as f:
+            pickle.dump(make_credentials(-60), f)
+        legacy_expired_ms = time_call(lambda: legacy_credentials(token_path), args.repeat)
+
+        # The token is due for a proactive refresh every (lifetime - margin) seconds,
+        # well before google-auth would consider it expired
+        with open(token_path, 'wb') as f:
+            pickle.dump(make_credentials(args.lifetime), f)
+        issued.clear()
+        cache = CredentialCache(token_path, refresh_margin=args.margin, check_interval=args.seconds)
+        first_start = time.perf_counter()
+        cache.get()
+        first_ms = (time.perf_counter() - first_start) * 1000
+
+        slowest = 0.0
+        calls = 0
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            creds = cache.get()
+            slowest = max(slowest, time.perf_counter() - start)
+            calls += 1
+            time.sleep(0.001)
+        cache.stop()
+        server.shutdown()
+
+        with open(token_path, 'rb') as f:
+            on_disk = pickle.load(f)
+        leftovers = [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+    stats = cache.stats()
+    print(f"\n{'legacy (valid token)':>24} {legacy_valid_ms:>8.3f} ms")
+    print(f"{'legacy (expired token)':>24} {legacy_expired_ms:>8.3f} ms")
+    print(f"{'cache (first call)':>24} {first_ms:>8.3f} ms")
+    print(f"{'cache (slowest call)':>24} {slowest * 1000:>8.3f} ms over {calls} calls")
+    print(f"\n{stats['refreshes']} background refresh(es), {stats['writes']} token write(s), "
+          f"{stats['failures']} failure(s) in {args.seconds:g} s")
+
+    failures = []
+    if not stats['refreshes'] or stats['failures']:
+        failures.append("the token was not refreshed in the background")
+    if slowest * 1000 >= args.latency_ms:
+        failures.append("a credential lookup waited on the token endpoint")
+    if stats['writes'] != stats['refreshes'] or on_disk.token != creds.token or leftovers:
+        failures.append("the token file does not hold the latest token")
+    if failures:
+        for failure in failures:
+            print(f"❌ Credential cache: {failure}.")
+        return 1
+    print("\n✅ Tokens were refreshed ahead of expiry without blocking lookups, and written back atomically.")
+    return 0
+
+
+def bench_payload(args):
+    """Compare legacy and columnar /api/dashboard-data payload sizes, plain and gzipped."""
+    import app_with_api as app
+    from wire_format import compress_body
+
+    user_id = 'benchmark'
+    records = make_fitness_records(args.days)
+    with app.app.test_request_context():
+        app.session['user_id'] = user_id
+        app.metrics_store.append(user_id, records)
+        try:
+            app.session['history_range'] = [records[0]['date'], records[-1]['date']]
+            app.session['predictions'] = app.generate_ml_predictions(records)
+            app.session['wellness_patterns'] = app.find_wellness_patterns(
+                records, app.get_user_goals(), app.session['predictions'])
+
+            print(f"\n{'format':<10} {'json bytes':>12} {'gzip bytes':>12}")
+            sizes = {}
+            for fmt in ('legacy', 'columnar'):
+                body = app.app.json.dumps(app.build_dashboard_payload(fmt)).encode('utf-8')
+                sizes[fmt] = (len(body), len(compress_body(body, 'gzip')))
+                print(f"{fmt:<10} {sizes[fmt][0]:>12} {sizes[fmt][1]:>12}")
+        finally:
+            app.metrics_store.delete_user(user_id)
+
+    legacy, columnar = sizes['legacy'], sizes['columnar']
+    print(f"\n📦 Columnar is {legacy[0] / columnar[0]:.1f}x smaller as JSON and "
+          f"{legacy[1] / columnar[1]:.1f}x smaller gzipped (both sides gzipped).")
+    return 0
+
+
+def make_item_flags(n_days, n_items, seed=0):
+    """Synthesize correlated daily boolean items (each item leans on the previous one)."""
+    rng = np.random.default_rng(seed)
+    flags = np.empty((n_days, n_items), dtype=bool)
+    flags[:, 0] = rng.random(n_days) < 0.5
+    for i in range(1, n_items):
+        follow = rng.random(n_days) < 0.6
+        flags[:, i] = np.where(follow, flags[:, i - 1], rng.random(n_days) < 0.4)
+    return flags
+
+
+def bench_patterns(args):
+    """Check the bitset and FP-growth engines against each other and mlxtend (when installed), and time them."""
+    try:
+        import pandas as pd
+        from mlxtend.frequent_patterns import apriori
+        from mlxtend.frequent_patterns import association_rules as mlxtend_rules
+    except ImportError:
+        apriori = None
+        print("⚠️ mlxtend not installed; comparing the bitset and FP-growth engines only.")
+
+    def mine(engine, flags):
+        itemsets = engine(pack_transactions(flags), flags.shape[1], args.min_support, max_len=args.max_len)
+        return itemsets, association_rules(itemsets, args.min_lift)
+
+    failures = 0
+    print(f"\n{'days':>6} {'items':>6} {'itemsets':>9} {'rules':>7} {'bitset':>10} {'fp-growth':>10} {'mlxtend':>10}")
+    for n_items in args.items:
+        for n_days in args.days:
+            flags = make_item_flags(n_days, n_items, seed=n_days + n_items)
+            itemsets, rules = mine(fp_growth, flags)
+            fp_ms = time_call(lambda: mine(fp_growth, flags), args.repeat)
+
+            bitset_ms = float('nan')
+            if n_items <= args.bitset_max_items:
+                if mine(frequent_itemsets, flags) != (itemsets, rules):
+                    failures += 1
+                    print(f"❌ FP-growth differs from the bitset engine at {n_days} days x {n_items} items")
+                bitset_ms = time_call(lambda: mine(frequent_itemsets, flags), args.repeat)
+
+            mlxtend_ms = float('nan')
+            if apriori is not None and n_items <= args.mlxtend_max_items:
+                df = pd.DataFrame(flags, columns=[str(i) for i in range(n_items)])
+
+                def reference():
+                    found = apriori(df, min_support=args.min_support, use_colnames=True, max_len=args.max_len)
+                    if found.empty:
+                        return found
+                    return mlxtend_rules(found, metric="lift", min_threshold=args.min_lift)
+
+                expected = reference()
+                mlxtend_ms = time_call(reference, args.repeat)
+                # mlxtend orders rules by frozenset hash, so compare as sets
+                want = {
+                    (frozenset(map(int, a)), frozenset(map(int, c)), round(conf, 9))
+                    for a, c, conf in zip(expected.get('antecedents', []), expected.get('consequents', []),
+                                          expected.get('confidence', []))
+                }
+                got = {(frozenset(mask_items(a)), frozenset(mask_items(c)), round(conf, 9))
+                       for a, c, _, conf, _ in rules}
+                if want != got:
+                    failures += 1
+                    print(f"❌ Rule mismatch with mlxtend at {n_days} days x {n_items} items "
+                          f"({len(got - want)} extra, {len(want - got)} missing)")
+            print(f"{n_days:>6} {n_items:>6} {len(itemsets):>9} {len(rules):>7} "
+                  f"{bitset_ms:>7.2f} ms {fp_ms:>7.2f} ms {mlxtend_ms:>7.2f} ms")
+
+    # Temporal mode: itemize + lagged window + mining on synthetic daily records
+    goals = {'steps': 10000, 'calories': 2500, 'active_minutes': 60, 'sleep_hours': 7.5}
+    print(f"\n{'days':>6} {'window':>7} {'items':>6} {'rules':>7} {'temporal':>10}")
+    for n_days in args.days:
+        records = make_fitness_records(n_days, seed=n_days)
+        for window in args.windows:
+            def temporal():
+                flags, names, groups = itemize(records, goals, config=TEMPORAL_ITEMIZATION)
+                flags, names, groups, lags = lagged_items(flags, names, groups, [r['date'] for r in records], window)
+                itemsets = fp_growth(pack_transactions(flags), flags.shape[1], args.min_support, max_len=args.max_len)
+                rules = temporal_rules(rules_across_groups(association_rules(itemsets, args.min_lift), groups), lags)
+                return names, rules
+
+            names, rules = temporal()
+            temporal_ms = time_call(temporal, args.repeat)
+            print(f"{n_days:>6} {window:>7} {len(names):>6} {len(rules):>7} {temporal_ms:>7.2f} ms")
+
+    # Incremental state: sync the full history with the latest day corrected, or unchanged,
+    # and compare against re-mining every transaction
+    print(f"\n{'days':>6} {'window':>7} {'build':>10} {'1-day fix':>10} {'no change':>10} {'re-mine':>10}")
+    for n_days in args.days:
+        records = make_fitness_records(n_days, seed=n_days)
+        corrected = records[:-1] + [dict(records[-1], sleep_minutes=records[-1]['sleep_minutes'] + 120)]
+        for window in [1] + args.windows:
+            config = DEFAULT_ITEMIZATION if window == 1 else TEMPORAL_ITEMIZATION
+            state = PatternState(goals, config, window, args.max_len)
+            build_ms = time_call(lambda: state.build(records), 1)
+            history = [records]
+
+            def fix_latest_day():
+                history[0] = corrected if history[0] is records else records
+                state.sync(history[0])
+
+            fix_ms = time_call(fix_latest_day, args.repeat)
+            same_ms = time_call(lambda: state.sync(history[0]), args.repeat)
+            state.sync(records)
+            rebuilt = PatternState(goals, config, window, args.max_len)
+            rebuilt.build(records)
+            if state.sync(records) != 0 or rebuilt.frequent_itemsets(args.min_support) != state.frequent_itemsets(args.min_support):
+                failures += 1
+                print(f"❌ Synced state differs from a fresh build at {n_days} days, window {window}")
+            n_items = len(state.vocabulary()[0])
+            remine = lambda: fp_growth(state.transactions(), n_items, args.min_support, max_len=args.max_len)
+            if remine() != state.frequent_itemsets(args.min_support):
+                failures += 1
+                print(f"❌ Incremental counts differ from re-mining at {n_days} days, window {window}")
+            remine_ms = time_call(remine, args.repeat)
+            print(f"{n_days:>6} {window:>7} {build_ms:>7.2f} ms {fix_ms:>7.2f} ms {same_ms:>7.2f} ms {remine_ms:>7.2f} ms")
+
+    if failures:
+        print("\n❌ Pattern engines disagree.")
+        return 1
+    print("\n✅ FP-growth and bitset engines agree" + (" with mlxtend apriori/association_rules." if apriori else "."))
+    return 0
+
+
+def legacy_recommendations(record, wellness_category, is_at_risk, goals):
+    """The original per-record if/elif recommendation chain, kept as the parity reference."""
+    recs = []
+    steps = record.get('steps', 0)
+    active_mins = record.get('active_minutes', 0)
+    sleep_mins = record.get('sleep_minutes', 0)
+    calories = record.get('calories', 0)
+    step_goal = goals.get('steps', 10000)
+    active_goal = goals.get('active_minutes', 60)
+    sleep_goal = goals.get('sleep_hours', 7.5) * 60
+    calorie_goal = goals.get('calories', 2500)
+
+    if steps < step_goal * 0.5:
+        recs.append(f"🚶‍♂️ You're at {int(steps/step_goal*100)}% of your step goal. Try to reach {int(step_goal*0.7)} steps today")
+    elif steps < step_goal:
+        recs.append(f"📈 Almost there! Just {step_goal - steps} more steps to reach your goal")
+    elif steps >= step_goal:
+        recs.append(f"🎉 Goal achieved! You've completed {int(steps/step_goal*100)}% of your step target")
+    if active_mins < active_goal * 0.5:
+        recs.append(f"⏰ Try to get {int(active_goal*0.7)}+ active minutes today")
+    elif active_mins >= active_goal:
+        recs.append(f"💪 Great job! You hit your active minutes goal")
+    if sleep_mins < sleep_goal * 0.8:
+        recs.append(f"😴 Try to get at least {sleep_goal/60:.1f} hours of sleep tonight")
+    elif sleep_mins >= sleep_goal:
+        recs.append(f"🌙 Well rested! You got {sleep_mins/60:.1f} hours of quality sleep")
+    if calories < calorie_goal * 0.7:
+        recs.append(f"🔥 Increase activity to burn more calories (Goal: {calorie_goal})")
+    elif calories >= calorie_goal:
+        recs.append(f"🔥 Excellent! You burned {int(calories/calorie_goal*100)}% of your calorie goal")
+    if wellness_category == 'At Risk' or is_at_risk:
+        recs.append("⚠️ Focus on improving your activity levels this week")
+    elif wellness_category == 'High Performance':
+        recs.append("🏆 Outstanding performance! Remember to include rest days")
+    return " | ".join(recs) if recs else "Keep up your current routine!"
+
+
+def bench_recommendations(args):
+    """Check the rule table against the legacy if/elif chain and compare latency."""
+    table = RuleTable.from_file(args.rules)
+    goal_sets = [
+        {'steps': 10000, 'calories': 2500, 'active_minutes': 60, 'sleep_hours': 7.5},
+        {'steps': 8000, 'calories': 2200, 'active_minutes': 45, 'sleep_hours': 8.0},
+        {'steps': 12000, 'calories': 3000, 'active_minutes': 90, 'sleep_hours': 6.5}
+    ]
+
+    failures = 0
+    print(f"\n{'rows':>6} {'per-record':>11} {'rule table':>11}")
+    for n in args.rows:
+        records = make_fitness_records(n, seed=n)
+        rng = np.random.default_rng(n)
+        categories = rng.choice(['Healthy', 'At Risk', 'High Performance'], n).tolist()
+        at_risk = (rng.random(n) < 0.3).tolist()
+        for goals in goal_sets:
+            expected = [legacy_recommendations(r, c, k, goals) for r, c, k in zip(records, categories, at_risk)]
+            got = table.evaluate(records, categories, at_risk, goals)
+            mismatches = sum(a != b for a, b in zip(expected, got))
+            if mismatches:
+                failures += 1
+                print(f"❌ {mismatches} of {n} recommendation strings differ (goals {goals})")
+
+        # The legacy chain divides by zero goals, so those are checked for sane text instead,
+        # and for agreement between the whole batch and its first few days on their own
+        zero_goals = {'steps': 0, 'calories': 0, 'active_minutes': 60, 'sleep_hours': 7.5}
+        got = table.evaluate(records, categories, at_risk, zero_goals)
+        head = table.evaluate(records[:30], categories[:30], at_risk[:30], zero_goals)
+        if head != got[:30] or any(bad in text for text in got for bad in ('inf', 'nan', '-9223372036854775808')):
+            failures += 1
+            print(f"❌ Zero goals give inconsistent or invalid recommendations ({n} rows)")
+
+        goals = goal_sets[0]
+        timings = [
+            time_call(lambda: [legacy_recommendations(r, c, k, goals)
+                               for r, c, k in zip(records, categories, at_risk)], args.repeat),
+            time_call(lambda: table.evaluate(records, categories, at_risk, goals), args.repeat),
+        ]
+        print(f"{n:>6} {timings[0]:>8.2f} ms {timings[1]:>8.2f} ms")
+
+    if failures:
+        print("\n❌ Rule table output differs from the legacy recommendations.")
+        return 1
+    print("\n✅ Rule table reproduces the legacy recommendation strings exactly.")
+    return 0
+
+
+def bench_imports(args):
+    """Time a cold ``import app_with_api`` in a fresh interpreter against a budget, and keep -X importtime output."""
+    # Model warm-up runs in a background thread and is not part of the import
+    env = dict(os.environ, MODEL_WARMUP='background')
+    code = (
+        "import time; start = time.perf_counter(); import app_with_api; "
+        "print((time.perf_counter() - start) * 1000)"
+    )
+    timings = []
+    for _ in range(args.repeat):
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+        if result.returncode:
+            print(result.stderr)
+            print("\n❌ import app_with_api failed.")
+            return 1
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    import_ms = float(np.median(timings))
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app_with_api'],
+                            env=env, capture_output=True, text=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(result.stderr)
+
+    # "import time: self [us] | cumulative | imported package"
+    entries = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if line.startswith('import time:') and len(parts) == 3 and parts[1].strip().isdigit():
+            entries.append((int(parts[1]), parts[2].rstrip()))
+    entries.sort(reverse=True)
+    print(f"\n{'cumulative':>12}  module")
+    for cumulative_us, module in entries[:args.top]:
+        print(f"{cumulative_us / 1000:>9.1f} ms  {module.strip()}")
+    print(f"\n📄 Full -X importtime output in {args.output}")
+
+    print(f"\nimport app_with_api: {import_ms:.1f} ms (median of {args.repeat}), budget {args.budget_ms:.0f} ms")
+    if import_ms > args.budget_ms:
+        print("\n❌ Import time exceeds the budget.")
+        return 1
+    print("\n✅ Import time is within the budget.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    forest = subparsers.add_parser('forest', help='compiled random forest parity + latency')
+    forest.add_argument('--rows', type=int, nargs='+', default=[1, 7, 30, 365])
+    forest.add_argument('--repeat', type=int, default=20)
+    forest.set_defaults(func=bench_forest)
+
+    cluster = subparsers.add_parser('cluster', help='fused scaler + KMeans parity + latency')
+    cluster.add_argument('--rows', type=int, nargs='+', default=[1, 7, 30, 365])
+    cluster.add_argument('--repeat', type=int, default=20)
+    cluster.set_defaults(func=bench_cluster)
+
+    models = subparsers.add_parser('models', help='unpickle + compile vs. memory-mapped model bundle startup')
+    models.add_argument('--rows', type=int, default=365)
+    models.add_argument('--repeat', type=int, default=5)
+    models.set_defaults(func=bench_models)
+
+    fetch = subparsers.add_parser('fetch', help='raw vs. aggregate Google Fit fetch: payload bytes + parse time')
+    fetch.add_argument('--days', type=int, default=365)
+    fetch.add_argument('--repeat', type=int, default=5)
+    fetch.set_defaults(func=bench_fetch)
+
+    clients = subparsers.add_parser('clients', help='per-request build() vs. shared Fitness service client factory')
+    clients.add_argument('--requests', type=int, default=100)
+    clients.add_argument('--threads', type=int, default=8)
+    clients.add_argument('--discovery', default='fitness_v1_discovery.json')
+    clients.set_defaults(func=bench_clients)
+
+    credentials = subparsers.add_parser('credentials', help='credential lookup: legacy unpickle/refresh vs. CredentialCache')
+    credentials.add_argument('--seconds', type=float, default=5)
+    credentials.add_argument('--lifetime', type=int, default=240)
+    credentials.add_argument('--margin', type=int, default=238)
+    credentials.add_argument('--latency-ms', type=float, default=200)
+    credentials.add_argument('--repeat', type=int, default=5)
+    credentials.set_defaults(func=bench_credentials)
+
+    payload = subparsers.add_parser('payload', help='legacy vs. columnar dashboard payload size')
+    payload.add_argument('--days', type=int, default=365)
+    payload.set_defaults(func=bench_payload)
+
+    patterns = subparsers.add_parser('patterns', help='FP-growth / bitset itemset engines vs. mlxtend apriori')
+    patterns.add_argument('--days', type=int, nargs='+', default=[30, 365, 1825])
+    patterns.add_argument('--items', type=int, nargs='+', default=[4, 12, 24, 56])
+    patterns.add_argument('--min-support', type=float, default=0.2)
+    patterns.add_argument('--min-lift', type=float, default=1.1)
+    patterns.add_argument('--max-len', type=int, default=3)
+    patterns.add_argument('--windows', type=int, nargs='+', default=[2, 3])
+    patterns.add_argument('--bitset-max-items', type=int, default=24)
+    patterns.add_argument('--mlxtend-max-items', type=int, default=16)
+    patterns.add_argument('--repeat', type=int, default=5)
+    patterns.set_defaults(func=bench_patterns)
+
+    recommendations = subparsers.add_parser('recommendations', help='rule table vs. legacy if/elif recommendations')
+    recommendations.add_argument('--rows', type=int, nargs='+', default=[1, 7, 30, 365, 5000])
+    recommendations.add_argument('--rules', default='recommendation_rules.json')
+    recommendations.add_argument('--repeat', type=int, default=20)
+    recommendations.set_defaults(func=bench_recommendations)
+
+    imports = subparsers.add_parser('imports', help='cold import time of app_with_api vs. a budget, with -X importtime')
+    imports.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', 1500)))
+    imports.add_argument('--output', default='importtime.log')
+    imports.add_argument('--top', type=int, default=15)
+    imports.add_argument('--repeat', type=int, default=5)
+    imports.set_defaults(func=bench_imports)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Compiled inference runtimes for the pickled wellness models.
+
+The sklearn random forests are flattened at load time into a handful of
+contiguous NumPy arrays so that a whole batch of rows can be pushed through
+every tree at once, without sklearn's per-estimator Python dispatch. The
+scaler + KMeans wellness clustering is likewise fused into one distance
+kernel over precomputed centroids.
+
+Both runtimes can be saved as a bundle of plain ``.npy`` arrays and loaded
+back with ``mmap_mode='r'``: every worker process then maps the same
+page-cache copy instead of unpickling its own sklearn object graphs.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+FOREST_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+BUNDLE_MANIFEST = 'manifest.json'
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class CompiledForest:
+    """A random forest flattened into contiguous node arrays.
+
+    All trees share one node table (feature, threshold, left, right, value).
+    Leaves point back at themselves, so traversal is just ``max_depth`` rounds
+    of a vectorized gather over a (n_trees, n_rows) index matrix.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 n_features, is_classifier, classes=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.is_classifier = is_classifier
+        self.classes_ = classes
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Flatten a fitted RandomForestClassifier/RandomForestRegressor."""
+        estimators = getattr(forest, 'estimators_', None)
+        if not estimators:
+            raise ValueError(f"{type(forest).__name__} has no fitted estimators_ to compile")
+        if getattr(forest, 'n_outputs_', 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        is_classifier = hasattr(forest, 'classes_')
+        n_classes = len(forest.classes_) if is_classifier else 1
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            node_count = tree.node_count
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            is_leaf = left == -1
+            own = np.arange(node_count, dtype=np.int64)
+
+            # Leaves loop back onto themselves so extra traversal rounds are no-ops
+            lefts.append(np.where(is_leaf, own, left) + offset)
+            rights.append(np.where(is_leaf, own, right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(tree.threshold.astype(np.float64))
+
+            if is_classifier:
+                # Same per-node normalization DecisionTreeClassifier.predict_proba applies
+                proba = tree.value[:, 0, :n_classes].astype(np.float64)
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                values.append(proba / normalizer)
+            else:
+                values.append(tree.value[:, 0, :1].astype(np.float64))
+
+            roots.append(offset)
+            max_depth = max(max_depth, int(tree.max_depth))
+            offset += node_count
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            left=np.ascontiguousarray(np.concatenate(lefts)),
+            right=np.ascontiguousarray(np.concatenate(rights)),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            n_features=int(forest.n_features_in_),
+            is_classifier=is_classifier,
+            classes=np.asarray(forest.classes_) if is_classifier else None,
+        )
+
+    def save(self, directory):
+        """Write the node arrays as .npy files plus a meta.json."""
+        os.makedirs(directory, exist_ok=True)
+        for name in FOREST_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name), allow_pickle=False)
+        _write_json(os.path.join(directory, 'meta.json'), {
+            'max_depth': self.max_depth,
+            'n_features': self.n_features,
+            'is_classifier': self.is_classifier,
+            'classes': self.classes_.tolist() if self.classes_ is not None else None
+        })
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load a saved forest; with mmap_mode the node arrays stay in the page cache, shared across processes."""
+        meta = _read_json(os.path.join(directory, 'meta.json'))
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in FOREST_ARRAYS
+        }
+        classes = meta['classes']
+        return cls(
+            **arrays,
+            max_depth=meta['max_depth'],
+            n_features=meta['n_features'],
+            is_classifier=meta['is_classifier'],
+            classes=np.asarray(classes) if classes is not None else None,
+        )
+
+    def apply(self, X):
+        """Return the global leaf index reached in every tree, shape (n_trees, n_rows)."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input of shape (n, {self.n_features}), got {X.shape}")
+
+        # sklearn trees compare float32 inputs against float64 thresholds
+        flat = X.astype(np.float32).astype(np.float64).ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.int64) * self.n_features)[np.newaxis, :]
+
+        nodes = np.repeat(self.roots[:, np.newaxis], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def _accumulate(self, X):
+        leaves = self.apply(X)
+        out = np.zeros((leaves.shape[1], self.value.shape[1]), dtype=np.float64)
+        # Accumulate tree by tree, in estimator order, exactly as sklearn does
+        for tree_leaves in leaves:
+            out += self.value[tree_leaves]
+        out /= self.n_trees
+        return out
+
+    def predict_proba(self, X):
+        """Class probabilities, identical to RandomForestClassifier.predict_proba."""
+        if not self.is_classifier:
+            raise AttributeError("predict_proba is only available for compiled classifiers")
+        return self._accumulate(X)
+
+    def predict(self, X):
+        """Predictions, identical to the source forest's predict()."""
+        out = self._accumulate(X)
+        if self.is_classifier:
+            return self.classes_.take(np.argmax(out, axis=1), axis=0)
+        return out[:, 0]
+
+
+class ClusterAssigner:
+    """StandardScaler + KMeans + cluster_mapping fused into one distance kernel.
+
+    Scaling is folded into the centroids: with w = 1 / scale,
+    ||(x - mean) * w - c||^2 == ||x * w - (c + mean * w)||^2, so cluster
+    assignment is a single matrix product against pre-transformed centroids
+    and the result is mapped straight to wellness category strings.
+    """
+
+    def __init__(self, weights, centroids, categories):
+        self.weights = weights
+        self.centroids = centroids
+        self.centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        self.categories = categories
+
+    @classmethod
+    def from_models(cls, scaler, kmeans, cluster_mapping, default='Healthy'):
+        """Precompute the fused kernel from the fitted scaler, KMeans and mapping."""
+        centers = np.asarray(kmeans.cluster_centers_, dtype=np.float64)
+        n_features = centers.shape[1]
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+
+        weights = 1.0 / scale
+        centroids = centers + mean * weights
+        categories = np.array(
+            [cluster_mapping.get(k, default) for k in range(len(centers))], dtype=object
+        )
+        return cls(weights, np.ascontiguousarray(centroids), categories)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'weights.npy'), self.weights, allow_pickle=False)
+        np.save(os.path.join(directory, 'centroids.npy'), self.centroids, allow_pickle=False)
+        _write_json(os.path.join(directory, 'meta.json'), {'categories': self.categories.tolist()})
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        meta = _read_json(os.path.join(directory, 'meta.json'))
+        return cls(
+            np.load(os.path.join(directory, 'weights.npy'), mmap_mode=mmap_mode, allow_pickle=False),
+            np.load(os.path.join(directory, 'centroids.npy'), mmap_mode=mmap_mode, allow_pickle=False),
+            np.array(meta['categories'], dtype=object),
+        )
+
+    def assign(self, X):
+        """Return the KMeans cluster index for every raw (unscaled) feature row."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.weights):
+            raise ValueError(f"Expected input of shape (n, {len(self.weights)}), got {X.shape}")
+        # ||x||^2 is constant per row, so it drops out of the argmin
+        distances = self.centroid_norms - 2.0 * ((X * self.weights) @ self.centroids.T)
+        return np.argmin(distances, axis=1)
+
+    def labels(self, X):
+        """Return the wellness category string for every raw feature row."""
+        return self.categories[self.assign(X)]
+
+    def label_histories(self, histories):
+        """Label many users' feature matrices in one pass; returns one label array per history."""
+        histories = [np.asarray(h, dtype=np.float64).reshape(-1, len(self.weights)) for h in histories]
+        if not histories:
+            return []
+        labels = self.labels(np.concatenate(histories))
+        return np.split(labels, np.cumsum([len(h) for h in histories])[:-1])
+
+
+def save_model_bundle(directory, version, classifier, regressor, assigner):
+    """Publish compiled models as <directory>/<version>/, atomically, and drop older versions.
+
+    Processes that still map an older version keep working: unlinked files
+    stay mapped until they are closed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, version)
+    staging = tempfile.mkdtemp(dir=directory, prefix='.staging-')
+    try:
+        classifier.save(os.path.join(staging, 'risk_classifier'))
+        regressor.save(os.path.join(staging, 'calorie_regressor'))
+        assigner.save(os.path.join(staging, 'cluster_assigner'))
+        _write_json(os.path.join(staging, BUNDLE_MANIFEST), {'version': version})
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process published the same version first
+            if not os.path.exists(os.path.join(target, BUNDLE_MANIFEST)):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    for name in os.listdir(directory):
+        if name != version and not name.startswith('.'):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def load_model_bundle(directory, version, mmap_mode='r'):
+    """(classifier, regressor, assigner) memory-mapped from a published bundle, or None if it is missing/stale."""
+    root = os.path.join(directory, version)
+    manifest = os.path.join(root, BUNDLE_MANIFEST)
+    if not os.path.exists(manifest) or _read_json(manifest).get('version') != version:
+        return None
+    return (
+        CompiledForest.load(os.path.join(root, 'risk_classifier'), mmap_mode),
+        CompiledForest.load(os.path.join(root, 'calorie_regressor'), mmap_mode),
+        ClusterAssigner.load(os.path.join(root, 'cluster_assigner'), mmap_mode),
+    )
@@ -0,0 +1,63 @@
+"""Shape-preserving downsampling of long chart series.
+
+Largest-Triangle-Three-Buckets (LTTB) keeps the first and last points and,
+for every bucket in between, the point forming the largest triangle with the
+previously kept point and the average of the next bucket. Callers can pin
+points (goal crossings, at-risk days) that must survive regardless.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the n_out points LTTB keeps from (x, y), sorted ascending."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    # Bucket edges over the interior points 1 .. n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            next_lo, next_hi = edges[b + 1], edges[b + 2]
+        else:
+            next_lo, next_hi = n - 1, n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+
+        # Twice the triangle area for each candidate in the bucket
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        kept[b + 1] = a
+    return kept
+
+
+def threshold_crossings(y, threshold):
+    """Indices on both sides of every point where y crosses ``threshold``."""
+    above = np.asarray(y) >= threshold
+    change = np.flatnonzero(above[1:] != above[:-1])
+    return np.union1d(change, change + 1)
+
+
+def downsample_indices(x, y, max_points, keep=None):
+    """LTTB indices for at most ~max_points points, always including ``keep``.
+
+    Pinned points are never dropped; LTTB fills whatever budget remains, so the
+    result only exceeds max_points when the pinned set alone is larger.
+    """
+    n = len(x)
+    keep = np.unique(np.asarray([] if keep is None else keep, dtype=np.int64))
+    keep = keep[(keep >= 0) & (keep < n)]
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    budget = max(max_points - len(keep), 2)
+    return np.union1d(lttb_indices(x, y, budget), keep)
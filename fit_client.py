@@ -0,0 +1,124 @@
+"""Process-wide Google Fit service objects and pooled authorized HTTP clients.
+
+``build("fitness", "v1", ...)`` loads and parses the discovery document and
+creates a fresh HTTP client on every call. FitnessClientFactory reads the
+bundled Fitness v1 discovery document once, builds one service object per
+credential, and keeps a pool of AuthorizedHttp clients per credential whose
+httplib2 connections stay open between requests.
+
+httplib2 clients are not thread-safe, so a client is checked out of the pool
+for the duration of one request (``with factory.http(creds) as http``); the
+service object itself is shared, since requests are executed with an explicit
+``http``.
+"""
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _CredentialClients:
+    """Service object plus idle AuthorizedHttp clients for one credential."""
+
+    def __init__(self, creds, service, max_idle, timeout):
+        self.creds = creds
+        self.service = service
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = []
+        self.created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+        import google_auth_httplib2
+        import httplib2
+        return google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=self.timeout))
+
+    def release(self, http):
+        with self._lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(http)
+                return
+        http.close()
+
+    def close(self):
+        with self._lock:
+            idle, self.idle = self.idle, []
+        for http in idle:
+            http.close()
+
+
+class FitnessClientFactory:
+    """Thread-safe factory of Fitness v1 service objects and pooled HTTP clients, keyed by credential object."""
+
+    def __init__(self, discovery_path='fitness_v1_discovery.json', max_credentials=16, max_idle=8, timeout=None):
+        self.discovery_path = discovery_path
+        self.max_credentials = max_credentials
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._document = None
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def document(self):
+        """The parsed discovery document, read from disk on first use."""
+        if self._document is None:
+            with open(self.discovery_path, encoding='utf-8') as f:
+                self._document = json.load(f)
+        return self._document
+
+    def _entry(self, creds):
+        key = id(creds)
+        with self._lock:
+            entry = self._clients.get(key)
+            # id() values are reused once an object is gone, so check identity too
+            if entry is None or entry.creds is not creds:
+                from googleapiclient.discovery import build_from_document
+
+                service = build_from_document(self.document(), credentials=creds)
+                entry = _CredentialClients(creds, service, self.max_idle, self.timeout)
+                self._clients[key] = entry
+                self.builds += 1
+            self._clients.move_to_end(key)
+            evicted = []
+            while len(self._clients) > self.max_credentials:
+                evicted.append(self._clients.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return entry
+
+    def service(self, creds):
+        """The shared Fitness v1 service object for ``creds``."""
+        return self._entry(creds).service
+
+    @contextmanager
+    def http(self, creds):
+        """Check out an AuthorizedHttp for ``creds`` for one request; it goes back to the pool afterwards."""
+        entry = self._entry(creds)
+        http = entry.acquire()
+        try:
+            yield http
+        finally:
+            entry.release(http)
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._clients.values())
+        return {
+            'credentials': len(entries),
+            'service_builds': self.builds,
+            'http_clients': sum(entry.created for entry in entries),
+            'idle_http_clients': sum(len(entry.idle) for entry in entries)
+        }
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for entry in entries:
+            entry.close()
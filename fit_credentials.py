@@ -0,0 +1,172 @@
+"""Google Fit OAuth credentials kept in memory and refreshed ahead of expiry.
+
+The token file is unpickled once per process. A daemon thread refreshes the
+access token ``refresh_margin`` seconds before it expires, in place, so the
+credential object (and the service clients keyed on it) stays the same. The
+token file is rewritten atomically, and only when the token actually changed.
+A request only refreshes synchronously when the background refresh has not
+kept up and the token has already expired.
+"""
+import os
+import pickle
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+
+class CredentialCache:
+    """Thread-safe in-memory credential holder with proactive background refresh."""
+
+    def __init__(self, token_path='token.pkl', refresh_margin=300, check_interval=60):
+        self.token_path = token_path
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.check_interval = check_interval
+        self._creds = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._request = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.writes = 0
+        self.failures = 0
+
+    def _load(self):
+        if not os.path.exists(self.token_path):
+            return None
+        try:
+            with open(self.token_path, 'rb') as token:
+                return pickle.load(token)
+        except Exception as e:
+            print(f"⚠️ Could not read {self.token_path}: {e}")
+            return None
+
+    def _save(self, creds):
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(creds, f)
+            os.replace(tmp_path, self.token_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.writes += 1
+
+    def _refresh(self, creds):
+        """Refresh ``creds`` in place and write them back if the token changed. Caller holds the lock."""
+        if self._request is None:
+            from google.auth.transport.requests import Request
+            self._request = Request()
+        before = (creds.token, creds.expiry)
+        creds.refresh(self._request)
+        self.refreshes += 1
+        if (creds.token, creds.expiry) != before:
+            try:
+                self._save(creds)
+            except OSError as e:
+                print(f"⚠️ Could not write {self.token_path}, keeping the refreshed token in memory: {e}")
+
+    def _due(self, creds):
+        """Whether ``creds`` can and should be refreshed now."""
+        if not creds.refresh_token:
+            return False
+        if creds.expiry is None:
+            return not creds.valid
+        return creds.expiry - datetime.utcnow() <= self.refresh_margin
+
+    def get(self):
+        """Usable credentials, or None when there are none and they can't be refreshed."""
+        # Lock-free while the token is valid, so lookups never wait on a background refresh
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+        with self._lock:
+            if not self._loaded:
+                self._creds = self._load()
+                self._loaded = True
+            creds = self._creds
+            if creds is not None and not creds.valid:
+                if creds.expired and creds.refresh_token:
+                    try:
+                        self._refresh(creds)
+                    except Exception as e:
+                        self.failures += 1
+                        print(f"❌ Token refresh failed: {e}")
+                        creds = None
+                else:
+                    creds = None
+                if creds is None:
+                    # Re-read token.pkl on the next call: another worker may have refreshed
+                    # the token or the user re-authorized since it was loaded
+                    self._creds = None
+                    self._loaded = False
+        if creds is not None:
+            self.start()
+        return creds
+
+    def set(self, creds):
+        """Adopt newly authorized credentials and persist them."""
+        with self._lock:
+            self._creds = creds
+            self._loaded = True
+            self._save(creds)
+        self.start()
+
+    def refresh_if_due(self):
+        """Refresh the cached credentials if they expire within refresh_margin. Returns whether they were refreshed."""
+        with self._lock:
+            creds = self._creds
+            if creds is None or not self._due(creds):
+                return False
+            try:
+                self._refresh(creds)
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Background token refresh failed, retrying in {self.check_interval}s: {e}")
+                return False
+        print("🔑 Refreshed Google Fit access token")
+        return True
+
+    def _seconds_until_due(self):
+        creds = self._creds
+        if creds is None or creds.expiry is None:
+            return self.check_interval
+        remaining = (creds.expiry - self.refresh_margin - datetime.utcnow()).total_seconds()
+        return min(self.check_interval, max(remaining, 0))
+
+    def _run(self):
+        delay = self._seconds_until_due()
+        while not self._stop.wait(delay):
+            failures = self.failures
+            refreshed = self.refresh_if_due()
+            delay = self._seconds_until_due()
+            # Retry a failed refresh on the next check rather than right away, and don't spin
+            # when a token's lifetime is shorter than the refresh margin
+            if self.failures > failures or (refreshed and delay == 0):
+                delay = self.check_interval
+
+    def start(self):
+        """Start the background refresher (once per process; threads don't survive a fork)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        creds = self._creds
+        return {
+            'loaded': creds is not None,
+            'expiry': creds.expiry.isoformat() if creds is not None and creds.expiry else None,
+            'refreshes': self.refreshes,
+            'writes': self.writes,
+            'failures': self.failures
+        }
@@ -0,0 +1,93 @@
+"""Vectorized reduction of raw Google Fit data points into daily values.
+
+Points are pulled into int64/float64 arrays in a single pass, bucketed into
+local days with integer arithmetic and reduced with ``np.bincount``; date
+strings are only formatted for the days that appear in the output.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+NANOS_PER_SECOND = 1_000_000_000
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+
+def extract_point_arrays(points, value_key, time_key='startTimeNanos'):
+    """(times_nanos int64, values float64) for points that carry ``value_key``."""
+    times = []
+    values = []
+    for p in points:
+        val = p.get("value", [{}])[0].get(value_key)
+        if val is not None:
+            times.append(int(p[time_key]))
+            values.append(val)
+    return np.array(times, dtype=np.int64), np.array(values, dtype=np.float64)
+
+
+def local_utc_offsets(seconds):
+    """Local UTC offset in seconds for each epoch second (DST-aware, resolved per hour)."""
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array(
+        [datetime.fromtimestamp(int(h) * 3600).astimezone().utcoffset().total_seconds() for h in hours],
+        dtype=np.int64
+    )
+    return offsets[inverse]
+
+
+def local_day_index(times_nanos, utc_offset_seconds=None):
+    """Days since 1970-01-01 in the user's local time for each nanosecond timestamp.
+
+    utc_offset_seconds fixes the offset; by default the machine's local zone is
+    used, matching datetime.fromtimestamp.
+    """
+    seconds = times_nanos // NANOS_PER_SECOND
+    if utc_offset_seconds is None:
+        utc_offset_seconds = local_utc_offsets(seconds)
+    return (seconds + utc_offset_seconds) // SECONDS_PER_DAY
+
+
+def format_days(day_indices):
+    """'YYYY-MM-DD' strings for an array of day indices."""
+    return [(EPOCH + timedelta(days=int(d))).strftime('%Y-%m-%d') for d in day_indices]
+
+
+def _group_by_day(times_nanos, utc_offset_seconds):
+    days, inverse = np.unique(local_day_index(times_nanos, utc_offset_seconds), return_inverse=True)
+    return days, inverse
+
+
+def daily_sum(times_nanos, values, decimals=0, utc_offset_seconds=None):
+    """{date: rounded sum of values} per local day."""
+    if len(times_nanos) == 0:
+        return {}
+    days, inverse = _group_by_day(times_nanos, utc_offset_seconds)
+    sums = np.round(np.bincount(inverse, weights=values, minlength=len(days)), decimals)
+    return dict(zip(format_days(days), sums.tolist()))
+
+
+def daily_mean(times_nanos, values, decimals=2, utc_offset_seconds=None):
+    """{date: rounded mean of values} per local day."""
+    if len(times_nanos) == 0:
+        return {}
+    days, inverse = _group_by_day(times_nanos, utc_offset_seconds)
+    sums = np.bincount(inverse, weights=values, minlength=len(days))
+    counts = np.bincount(inverse, minlength=len(days))
+    return dict(zip(format_days(days), np.round(sums / counts, decimals).tolist()))
+
+
+def daily_sleep_minutes(points, sleep_stages=(2, 4, 5, 6), utc_offset_seconds=None):
+    """{date: total sleep minutes} for sleep segments, attributed to the day they end."""
+    starts = []
+    ends = []
+    for p in points:
+        stage = p.get("value", [{}])[0].get("intVal")
+        if stage in sleep_stages:
+            starts.append(int(p["startTimeNanos"]))
+            ends.append(int(p["endTimeNanos"]))
+    if not starts:
+        return {}
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    minutes = (ends - starts) / (60 * NANOS_PER_SECOND)
+    return daily_sum(ends, minutes, decimals=0, utc_offset_seconds=utc_offset_seconds)
@@ -0,0 +1,146 @@
+"""Persistent per-day Google Fit aggregates for incremental sync.
+
+Each data source keeps its daily totals (or means) in SQLite together with the
+span it has synced: a low-water mark (start of the earliest fetched range) and
+a high-water mark (end of the latest one). Later syncs only request data newer
+than the high-water mark, minus a short re-check window for late-arriving
+points, plus any part of a longer window that reaches back past the low-water
+mark.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_aggregates (
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (source, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_state (
+    source TEXT PRIMARY KEY,
+    high_water_nanos INTEGER NOT NULL,
+    low_water_nanos INTEGER
+);
+"""
+
+
+def local_midnight_nanos(day):
+    """Nanosecond timestamp of local midnight at the start of ``day`` (a date)."""
+    return int(datetime.combine(day, time.min).timestamp() * 1e9)
+
+
+def nearest_local_date(nanos):
+    """Local date whose midnight is nearest to ``nanos``.
+
+    Labels day buckets by the day they cover even when their start is an hour
+    off local midnight after a DST change.
+    """
+    return (datetime.fromtimestamp(nanos / 1e9) + timedelta(hours=12)).date()
+
+
+def local_timezone_name():
+    """IANA name of the local time zone (from TZ or the /etc/localtime link), or None if unknown."""
+    candidates = [os.environ.get('TZ', '').lstrip(':')]
+    localtime = os.path.realpath('/etc/localtime')
+    if 'zoneinfo/' in localtime:
+        candidates.append(localtime.split('zoneinfo/', 1)[1])
+    for name in candidates:
+        if not name or name.startswith('/'):
+            continue
+        try:
+            ZoneInfo(name)
+        except (ValueError, OSError):
+            continue
+        return name
+    return None
+
+
+class DailyAggregateStore:
+    """SQLite-backed store of per-source daily aggregates and sync high-water marks."""
+
+    def __init__(self, path='fit_sync.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            # Stores created before the low-water mark existed; NULL means "unknown", so the
+            # next sync of each source re-fetches its whole window once
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sync_state)")]
+            if 'low_water_nanos' not in columns:
+                self._conn.execute("ALTER TABLE sync_state ADD COLUMN low_water_nanos INTEGER")
+
+    def sync_marks(self, source):
+        """(low_water_nanos, high_water_nanos) of ``source``; (None, None) if never synced."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT low_water_nanos, high_water_nanos FROM sync_state WHERE source = ?", (source,)
+            ).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def high_water_nanos(self, source):
+        """End of the last successful fetch for ``source``, or None if never synced."""
+        return self.sync_marks(source)[1]
+
+    def sync_ranges(self, source, window_start, end_nanos, recheck_days=2):
+        """[(from_nanos, to_nanos)] ranges the next fetch of ``source`` should request.
+
+        The recent range starts at the high-water mark minus ``recheck_days``; a
+        window starting before the low-water mark adds a backfill range up to
+        it. Ranges never start before ``window_start`` (a datetime) and are
+        aligned to local midnight, so re-fetched days are complete and can
+        replace stored ones.
+        """
+        window_nanos = local_midnight_nanos(window_start.date())
+        low_water, high_water = self.sync_marks(source)
+        if low_water is None or high_water is None:
+            return [(window_nanos, end_nanos)]
+        last_synced_day = datetime.fromtimestamp(high_water / 1e9).date()
+        recent_nanos = max(window_nanos, local_midnight_nanos(last_synced_day - timedelta(days=recheck_days)))
+        if window_nanos >= low_water:
+            return [(recent_nanos, end_nanos)]
+        if low_water >= recent_nanos:
+            return [(window_nanos, end_nanos)]
+        return [(window_nanos, low_water), (recent_nanos, end_nanos)]
+
+    def replace_days(self, source, daily_values, from_nanos, to_nanos):
+        """Replace the stored days of ``source`` in [from_nanos, to_nanos) and widen its synced span."""
+        from_date = datetime.fromtimestamp(from_nanos / 1e9).strftime('%Y-%m-%d')
+        # Last day starting before to_nanos
+        to_date = datetime.fromtimestamp((to_nanos - 1) / 1e9).strftime('%Y-%m-%d')
+        low_water, high_water = self.sync_marks(source)
+        low_water = from_nanos if low_water is None else min(low_water, from_nanos)
+        high_water = to_nanos if high_water is None else max(high_water, to_nanos)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM daily_aggregates WHERE source = ? AND date >= ? AND date <= ?",
+                (source, from_date, to_date)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO daily_aggregates (source, date, value) VALUES (?, ?, ?)",
+                [(source, date, float(value)) for date, value in daily_values.items() if from_date <= date <= to_date]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (source, high_water_nanos, low_water_nanos) VALUES (?, ?, ?)",
+                (source, int(high_water), None if low_water is None else int(low_water))
+            )
+
+    def load_days(self, source, start_date, end_date=None):
+        """Stored {date: value} for ``source`` between the two 'YYYY-MM-DD' dates (inclusive)."""
+        query = "SELECT date, value FROM daily_aggregates WHERE source = ? AND date >= ?"
+        params = [source, start_date]
+        if end_date is not None:
+            query += " AND date <= ?"
+            params.append(end_date)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY date", params).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
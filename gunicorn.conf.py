@@ -0,0 +1,20 @@
+"""Preload-then-fork multi-worker deployment for app_with_api.
+
+    MODEL_LOADING=mmap gunicorn -c gunicorn.conf.py app_with_api:app
+
+The master imports the app once (preload_app), which maps the model arrays and
+builds all module state. Workers are then forked from it. Everything is
+collected and frozen right before each fork, so workers' collections never
+touch (and copy) the shared pages. The GC stays on in the master, which keeps
+running (and respawning workers) for the life of the server.
+"""
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    import app_with_api
+    app_with_api.prepare_for_fork()
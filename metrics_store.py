@@ -0,0 +1,335 @@
+"""Columnar per-user storage of daily fitness metrics.
+
+Each user's history is one partition of equally long NumPy columns sorted by
+day (days since 1970-01-01), persisted as an ``.npz`` file. Range reads are two
+``searchsorted`` calls and a slice; appends merge by day, so re-fetched days
+replace older values.
+
+Weekly and monthly rollups (per-bucket sums, min/max and goal-hit counts) are
+kept next to each partition. An append only recomputes the buckets its days
+fall into, so rollups are never rebuilt from the whole history.
+
+Several processes (gunicorn workers) can share one directory: cached arrays
+are re-read when their file changes on disk, and read-merge-write updates
+hold a per-user file lock.
+"""
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process locking, single-process deployments only
+    fcntl = None
+
+EPOCH = date(1970, 1, 1)
+
+# Column name -> dtype, in combined_data order (after 'date')
+METRIC_COLUMNS = {
+    'steps': np.int64,
+    'calories': np.int64,
+    'active_minutes': np.int64,
+    'heart_minutes': np.int64,
+    'sleep_minutes': np.int64,
+    'weight': np.float64,
+    'height': np.float64,
+    'bmi': np.float64
+}
+
+# Rollups: metrics summed per bucket, and metrics counted against a goal threshold
+ROLLUP_GRANULARITIES = ('week', 'month')
+ROLLUP_METRICS = ('steps', 'calories', 'active_minutes', 'sleep_minutes', 'bmi')
+GOAL_METRICS = ('steps', 'calories', 'active_minutes', 'sleep_minutes')
+
+USER_PATTERN = re.compile(r'^[A-Za-z0-9_.@-]+$')
+
+
+def file_signature(path):
+    """(inode, mtime, size) of ``path``, or None if it doesn't exist. Atomic replaces change the inode."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock held on ``path`` (created if missing) for the block."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def date_to_day(date_str):
+    return (datetime.strptime(date_str, '%Y-%m-%d').date() - EPOCH).days
+
+
+def day_to_date(day):
+    return (EPOCH + timedelta(days=int(day))).strftime('%Y-%m-%d')
+
+
+def empty_columns():
+    columns = {'day': np.empty(0, dtype=np.int64)}
+    columns.update({name: np.empty(0, dtype=dtype) for name, dtype in METRIC_COLUMNS.items()})
+    return columns
+
+
+def records_to_columns(records):
+    """combined_data-style list of dicts -> dict of columns (unsorted)."""
+    columns = {'day': np.array([date_to_day(r['date']) for r in records], dtype=np.int64)}
+    for name, dtype in METRIC_COLUMNS.items():
+        columns[name] = np.array([r.get(name, 0) for r in records], dtype=dtype)
+    return columns
+
+
+def columns_to_records(columns):
+    """Dict of columns -> combined_data-style list of dicts."""
+    dates = [day_to_date(d) for d in columns['day']]
+    values = {name: columns[name].tolist() for name in METRIC_COLUMNS}
+    return [
+        {'date': date_str, **{name: values[name][i] for name in METRIC_COLUMNS}}
+        for i, date_str in enumerate(dates)
+    ]
+
+
+def goal_thresholds(goals):
+    """Per-metric thresholds a day must reach to count as a goal hit (same as pattern mining)."""
+    return np.array([
+        goals.get('steps', 10000),
+        goals.get('calories', 2500),
+        goals.get('active_minutes', 60),
+        goals.get('sleep_hours', 7.5) * 60 * 0.9
+    ], dtype=np.float64)
+
+
+def bucket_ids(days, granularity):
+    """Week (Monday-based) or month bucket id for each day index."""
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == 'week':
+        return (days + 3) // 7  # 1970-01-01 was a Thursday
+    if granularity == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+def bucket_start_days(buckets, granularity):
+    """First day index of each bucket."""
+    buckets = np.asarray(buckets, dtype=np.int64)
+    if granularity == 'week':
+        return buckets * 7 - 3
+    return buckets.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def empty_rollup(thresholds):
+    rollup = {'bucket': np.empty(0, dtype=np.int64), 'count': np.empty(0, dtype=np.int64)}
+    for name in ROLLUP_METRICS:
+        rollup[f'{name}_sum'] = np.empty(0, dtype=np.float64)
+        rollup[f'{name}_min'] = np.empty(0, dtype=np.float64)
+        rollup[f'{name}_max'] = np.empty(0, dtype=np.float64)
+    for name in GOAL_METRICS:
+        rollup[f'{name}_hits'] = np.empty(0, dtype=np.int64)
+    rollup['thresholds'] = np.asarray(thresholds, dtype=np.float64)
+    return rollup
+
+
+def compute_rollup(columns, granularity, thresholds):
+    """Rollup rows for whole buckets of day-sorted ``columns``."""
+    rollup = empty_rollup(thresholds)
+    if not len(columns['day']):
+        return rollup
+    buckets = bucket_ids(columns['day'], granularity)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    rollup['bucket'] = buckets[starts]
+    rollup['count'] = np.diff(np.r_[starts, len(buckets)])
+    for name in ROLLUP_METRICS:
+        values = columns[name].astype(np.float64)
+        rollup[f'{name}_sum'] = np.add.reduceat(values, starts)
+        rollup[f'{name}_min'] = np.minimum.reduceat(values, starts)
+        rollup[f'{name}_max'] = np.maximum.reduceat(values, starts)
+    for name, threshold in zip(GOAL_METRICS, thresholds):
+        rollup[f'{name}_hits'] = np.add.reduceat((columns[name] >= threshold).astype(np.int64), starts)
+    return rollup
+
+
+class MetricsStore:
+    """Per-user columnar daily metrics, persisted as one .npz partition per user."""
+
+    def __init__(self, directory='metrics_store'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # user -> (file signature, columns); (user, granularity) -> (file signature, rollup)
+        self._partitions = {}
+        self._rollups = {}
+        self._lock = threading.Lock()
+
+    def _path(self, user_id, suffix=''):
+        if not USER_PATTERN.match(user_id):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.directory, f"{user_id}{suffix}.npz")
+
+    def _user_lock(self, user_id):
+        """Serializes read-merge-write updates of one user across processes."""
+        return file_lock(self._path(user_id)[:-len('.npz')] + '.lock')
+
+    def _write_npz(self, path, arrays):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _load_rollup(self, user_id, granularity):
+        key = (user_id, granularity)
+        path = self._path(user_id, f'.{granularity}')
+        stored = file_signature(path)
+        # Without a rollup file the rollup is derived from the partition, so it follows that file
+        signature = stored if stored is not None else ('partition', file_signature(self._path(user_id)))
+        cached = self._rollups.get(key)
+        if cached is None or cached[0] != signature:
+            if stored is not None:
+                with np.load(path) as data:
+                    rollup = {name: data[name] for name in data.files}
+            else:
+                # First use: roll up whatever history already exists, with default goals
+                rollup = compute_rollup(self._load(user_id), granularity, goal_thresholds({}))
+            self._rollups[key] = cached = (signature, rollup)
+        return cached[1]
+
+    def _save_rollup(self, user_id, granularity, rollup):
+        path = self._path(user_id, f'.{granularity}')
+        self._write_npz(path, rollup)
+        self._rollups[(user_id, granularity)] = (file_signature(path), rollup)
+
+    def _update_rollups(self, user_id, columns, touched_days):
+        """Recompute only the buckets containing ``touched_days`` and splice them in."""
+        for granularity in ROLLUP_GRANULARITIES:
+            rollup = self._load_rollup(user_id, granularity)
+            touched = np.unique(bucket_ids(touched_days, granularity))
+            bucket_starts = bucket_start_days(touched, granularity)
+            bucket_ends = bucket_start_days(touched + 1, granularity)
+            # Day-sorted columns: each touched bucket is one contiguous slice
+            lo = np.searchsorted(columns['day'], bucket_starts, side='left')
+            hi = np.searchsorted(columns['day'], bucket_ends, side='left')
+            rows = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)]) if len(lo) else np.empty(0, dtype=np.int64)
+            fresh = compute_rollup({name: column[rows] for name, column in columns.items()},
+                                   granularity, rollup['thresholds'])
+
+            keep = ~np.isin(rollup['bucket'], touched)
+            merged = {
+                name: np.concatenate([rollup[name][keep], fresh[name]])
+                for name in rollup if name != 'thresholds'
+            }
+            order = np.argsort(merged['bucket'], kind='stable')
+            updated = {name: column[order] for name, column in merged.items()}
+            updated['thresholds'] = rollup['thresholds']
+            self._save_rollup(user_id, granularity, updated)
+
+    def _load(self, user_id):
+        path = self._path(user_id)
+        signature = file_signature(path)
+        cached = self._partitions.get(user_id)
+        if cached is None or cached[0] != signature:
+            if signature is not None:
+                with np.load(path) as data:
+                    columns = {name: data[name] for name in data.files}
+            else:
+                columns = empty_columns()
+            self._partitions[user_id] = cached = (signature, columns)
+        return cached[1]
+
+    def _save(self, user_id, columns):
+        path = self._path(user_id)
+        self._write_npz(path, columns)
+        self._partitions[user_id] = (file_signature(path), columns)
+
+    def append(self, user_id, records):
+        """Merge daily records into the user's partition; incoming days replace stored ones."""
+        if not records:
+            return
+        incoming = records_to_columns(records)
+        with self._lock, self._user_lock(user_id):
+            current = self._load(user_id)
+            # Keep the last occurrence of each day, incoming rows winning over stored ones
+            merged = {name: np.concatenate([current[name], incoming[name]]) for name in current}
+            order = np.argsort(merged['day'], kind='stable')
+            days = merged['day'][order]
+            keep = np.append(days[1:] != days[:-1], True)
+            columns = {name: column[order][keep] for name, column in merged.items()}
+            self._save(user_id, columns)
+            self._update_rollups(user_id, columns, incoming['day'])
+
+    def set_goals(self, user_id, goals):
+        """Re-count goal hits for new goal thresholds. Sums and min/max are untouched."""
+        thresholds = goal_thresholds(goals)
+        with self._lock, self._user_lock(user_id):
+            columns = self._load(user_id)
+            for granularity in ROLLUP_GRANULARITIES:
+                rollup = self._load_rollup(user_id, granularity)
+                if np.array_equal(rollup['thresholds'], thresholds):
+                    continue
+                updated = dict(rollup)
+                updated['thresholds'] = thresholds
+                if len(columns['day']):
+                    buckets = bucket_ids(columns['day'], granularity)
+                    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+                    for name, threshold in zip(GOAL_METRICS, thresholds):
+                        updated[f'{name}_hits'] = np.add.reduceat(
+                            (columns[name] >= threshold).astype(np.int64), starts
+                        )
+                self._save_rollup(user_id, granularity, updated)
+
+    def read_rollup(self, user_id, granularity, start_date=None, end_date=None):
+        """Rollup rows for every bucket overlapping [start_date, end_date] (whole buckets)."""
+        with self._lock:
+            rollup = self._load_rollup(user_id, granularity)
+        buckets = rollup['bucket']
+        lo = 0 if start_date is None else np.searchsorted(
+            buckets, bucket_ids([date_to_day(start_date)], granularity)[0], side='left')
+        hi = len(buckets) if end_date is None else np.searchsorted(
+            buckets, bucket_ids([date_to_day(end_date)], granularity)[0], side='right')
+        return {name: (column if name == 'thresholds' else column[lo:hi]) for name, column in rollup.items()}
+
+    def read_range(self, user_id, start_date=None, end_date=None):
+        """Columns for days in [start_date, end_date] ('YYYY-MM-DD', inclusive; None = open)."""
+        with self._lock:
+            columns = self._load(user_id)
+        days = columns['day']
+        lo = 0 if start_date is None else np.searchsorted(days, date_to_day(start_date), side='left')
+        hi = len(days) if end_date is None else np.searchsorted(days, date_to_day(end_date), side='right')
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def read_records(self, user_id, start_date=None, end_date=None):
+        """Same as read_range, as a combined_data-style list of dicts."""
+        return columns_to_records(self.read_range(user_id, start_date, end_date))
+
+    def date_bounds(self, user_id):
+        """(first_date, last_date) stored for the user, or None."""
+        with self._lock:
+            days = self._load(user_id)['day']
+        if not len(days):
+            return None
+        return day_to_date(days[0]), day_to_date(days[-1])
+
+    def delete_user(self, user_id):
+        with self._lock, self._user_lock(user_id):
+            self._partitions.pop(user_id, None)
+            for suffix in ('',) + tuple(f'.{g}' for g in ROLLUP_GRANULARITIES):
+                self._rollups.pop((user_id, suffix[1:]), None)
+                path = self._path(user_id, suffix)
+                if os.path.exists(path):
+                    os.remove(path)
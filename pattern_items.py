@@ -0,0 +1,284 @@
+"""Itemization of daily fitness records for wellness pattern mining.
+
+Each day becomes a row of named boolean items: goal hits, per-metric quantile
+bins, weekday/weekend, BMI band, and the wellness category and at-risk flag
+from the model predictions. Every item also carries a group (the metric or
+signal it came from), so rules that merely restate one metric, like
+"High Steps -> Met Step Goal", can be dropped.
+
+For cross-day rules, ``lagged_items`` lays a sliding window of k days side by
+side (today, the day before, ...), and ``temporal_rules`` keeps the rules that
+predict today's items from earlier days'.
+"""
+import re
+
+import numpy as np
+
+from metrics_store import GOAL_METRICS, date_to_day, goal_thresholds
+from pattern_mining import mask_items
+
+GOAL_ITEM_NAMES = ('Met_Step_Goal', 'Met_Calorie_Goal', 'Met_Active_Goal', 'Good_Sleep')
+
+METRIC_LABELS = {
+    'steps': 'Steps',
+    'calories': 'Calories',
+    'active_minutes': 'Active_Minutes',
+    'heart_minutes': 'Heart_Minutes',
+    'sleep_minutes': 'Sleep'
+}
+
+# Clauses for insight text; {is} becomes "was" for items from earlier days
+GOAL_ITEM_CLAUSES = {
+    'Met_Step_Goal': 'your step goal {is} met',
+    'Met_Calorie_Goal': 'your calorie goal {is} met',
+    'Met_Active_Goal': 'your active-minutes goal {is} met',
+    'Good_Sleep': 'your sleep {is} good'
+}
+
+METRIC_CLAUSES = {
+    'steps': 'your step count',
+    'calories': 'your calorie burn',
+    'active_minutes': 'your active time',
+    'heart_minutes': 'your heart-minute total',
+    'sleep_minutes': 'your sleep time'
+}
+
+ITEM_CLAUSES = {
+    **GOAL_ITEM_CLAUSES,
+    'Weekend': 'it {is} a weekend',
+    'Weekday': 'it {is} a weekday',
+    'Underweight_BMI': 'your BMI {is} in the underweight range',
+    'Normal_BMI': 'your BMI {is} in the normal range',
+    'Overweight_BMI': 'your BMI {is} in the overweight range',
+    'Obese_BMI': 'your BMI {is} in the obese range',
+    'Predicted_At_Risk': 'your day {is} predicted at risk'
+}
+
+# Upper bound (exclusive) of each BMI band
+BMI_BANDS = (
+    (18.5, 'Underweight_BMI'),
+    (25.0, 'Normal_BMI'),
+    (30.0, 'Overweight_BMI'),
+    (np.inf, 'Obese_BMI')
+)
+
+DEFAULT_ITEMIZATION = {
+    'goals': True,
+    'quantile_bins': {'steps': 3, 'calories': 3, 'active_minutes': 3, 'heart_minutes': 3, 'sleep_minutes': 3},
+    'day_type': True,
+    'bmi_bands': True,
+    'wellness_category': True,
+    'at_risk': True
+}
+
+# The original four-flag vocabulary
+GOALS_ONLY_ITEMIZATION = {'goals': True}
+
+# Smaller vocabulary for temporal mining: every item is repeated once per day in the window
+TEMPORAL_ITEMIZATION = {
+    'goals': True,
+    'quantile_bins': {'steps': 3, 'active_minutes': 3, 'sleep_minutes': 3},
+    'day_type': True
+}
+
+
+def bin_labels(n_bins):
+    if n_bins == 2:
+        return ('Low', 'High')
+    if n_bins == 3:
+        return ('Low', 'Mid', 'High')
+    return tuple(f'Q{i + 1}' for i in range(n_bins))
+
+
+def quantile_edges(values, n_bins):
+    """Interior quantile edges of the present (> 0) values, or None with too few of them."""
+    values = np.asarray(values, dtype=np.float64)
+    present = values[values > 0]
+    if len(present) < n_bins:
+        return None
+    return np.quantile(present, np.linspace(0, 1, n_bins + 1)[1:-1])
+
+
+def quantile_bins(values, edges):
+    """Bin index of each value against quantile ``edges``; -1 where the value is missing (<= 0) or edges is None."""
+    values = np.asarray(values, dtype=np.float64)
+    bins = np.full(len(values), -1, dtype=np.int64)
+    if edges is None:
+        return bins
+    present = values > 0
+    bins[present] = np.searchsorted(edges, values[present], side='right')
+    return bins
+
+
+def fixed_item_count(config):
+    """Number of items ``config`` can produce, not counting wellness categories (those come from the model)."""
+    return (len(GOAL_ITEM_NAMES) * bool(config.get('goals'))
+            + sum((config.get('quantile_bins') or {}).values())
+            + 2 * bool(config.get('day_type'))
+            + len(BMI_BANDS) * bool(config.get('bmi_bands'))
+            + bool(config.get('at_risk')))
+
+
+def history_bin_edges(records, config):
+    """{metric: quantile edges} for every binned metric in ``config``."""
+    return {
+        metric: quantile_edges([record.get(metric, 0) for record in records], n_bins)
+        for metric, n_bins in (config.get('quantile_bins') or {}).items()
+    }
+
+
+def itemize(records, goals, predictions=None, config=None, bin_edges=None, drop_empty=True):
+    """(flags, names, groups) for combined_data-style records.
+
+    ``flags`` is an (n_days, n_items) boolean matrix. Items that never occur
+    are left out unless ``drop_empty`` is False. ``bin_edges`` (from
+    history_bin_edges) fixes the quantile bins instead of taking them from
+    ``records``.
+    """
+    config = DEFAULT_ITEMIZATION if config is None else config
+    n_days = len(records)
+
+    def column(key):
+        return np.array([record.get(key, 0) for record in records], dtype=np.float64)
+
+    flags, names, groups = [], [], []
+
+    def add(flag, name, group):
+        flags.append(np.asarray(flag, dtype=bool))
+        names.append(name)
+        groups.append(group)
+
+    if config.get('goals'):
+        hits = np.column_stack([column(metric) for metric in GOAL_METRICS]) >= goal_thresholds(goals)
+        for i, (name, metric) in enumerate(zip(GOAL_ITEM_NAMES, GOAL_METRICS)):
+            add(hits[:, i], name, metric)
+
+    for metric, n_bins in (config.get('quantile_bins') or {}).items():
+        values = column(metric)
+        edges = quantile_edges(values, n_bins) if bin_edges is None else bin_edges.get(metric)
+        bins = quantile_bins(values, edges)
+        for b, label in enumerate(bin_labels(n_bins)):
+            add(bins == b, f'{label}_{METRIC_LABELS.get(metric, metric)}', metric)
+
+    if config.get('day_type'):
+        # 1970-01-01 was a Thursday; Monday = 0
+        weekday = (np.array([date_to_day(record['date']) for record in records], dtype=np.int64) + 3) % 7
+        add(weekday >= 5, 'Weekend', 'day_type')
+        add(weekday < 5, 'Weekday', 'day_type')
+
+    if config.get('bmi_bands'):
+        bmi = column('bmi')
+        band = np.searchsorted([upper for upper, _ in BMI_BANDS], bmi, side='right')
+        for b, (_, name) in enumerate(BMI_BANDS):
+            add((bmi > 0) & (band == b), name, 'bmi')
+
+    if predictions and (config.get('wellness_category') or config.get('at_risk')):
+        by_date = {p['date']: p for p in predictions}
+        matched = [by_date.get(record['date']) for record in records]
+        if config.get('wellness_category'):
+            categories = np.array([p['wellness_category'] if p else '' for p in matched], dtype=object)
+            for category in sorted(set(categories) - {''}):
+                add(categories == category, f"{category.replace(' ', '_')}_Day", 'wellness')
+        if config.get('at_risk'):
+            add([bool(p and p.get('is_at_risk')) for p in matched], 'Predicted_At_Risk', 'wellness')
+
+    if not flags:
+        return np.zeros((n_days, 0), dtype=bool), [], []
+    matrix = np.column_stack(flags)
+    if not drop_empty:
+        return matrix, names, groups
+    present = matrix.any(axis=0)
+    return (
+        matrix[:, present],
+        [name for name, p in zip(names, present) if p],
+        [group for group, p in zip(groups, present) if p]
+    )
+
+
+def rules_across_groups(rules, groups):
+    """Drop rules whose antecedent and consequent share a source group."""
+    def group_set(mask):
+        return {groups[i] for i in mask_items(mask)}
+    return [rule for rule in rules if not group_set(rule[0]) & group_set(rule[1])]
+
+
+def lag_suffix(lag):
+    return '_the_day_before' if lag == 1 else f'_{lag}_days_before'
+
+
+def split_lag(name):
+    """(base item name, lag) of a possibly lagged item name."""
+    if name.endswith(lag_suffix(1)):
+        return name[:-len(lag_suffix(1))], 1
+    match = re.fullmatch(r'(.+)_(\d+)_days_before', name)
+    return (match[1], int(match[2])) if match else (name, 0)
+
+
+def is_goal_item(name):
+    return split_lag(name)[0] in GOAL_ITEM_CLAUSES
+
+
+def item_clause(name):
+    """Readable clause for an item, e.g. "your step count is high" or "it was a weekend the day before"."""
+    base, lag = split_lag(name)
+    clause = ITEM_CLAUSES.get(base)
+    if clause is None:
+        label, _, metric_label = base.partition('_')
+        metric = next((m for m, l in METRIC_LABELS.items() if l == metric_label), None)
+        if base.endswith('_Day'):
+            clause = f"your wellness rating {{is}} {base[:-len('_Day')].replace('_', ' ')}"
+        elif metric is not None:
+            level = 'moderate' if label == 'Mid' else label.lower() if label in ('Low', 'High') else f'in quantile {label[1:]}'
+            clause = f'{METRIC_CLAUSES[metric]} {{is}} {level}'
+        else:
+            clause = base.replace('_', ' ')
+    clause = clause.replace('{is}', 'was' if lag else 'is')
+    if lag:
+        clause += ' the day before' if lag == 1 else f' {lag} days before'
+    return clause
+
+
+def lagged_vocabulary(names, groups, window):
+    """(names, groups, lags) of the window-wide item columns, today's items first."""
+    lagged_names = [name + (lag_suffix(lag) if lag else '') for lag in range(window) for name in names]
+    lagged_groups = [group if not lag else (group, lag) for lag in range(window) for group in groups]
+    return lagged_names, lagged_groups, np.repeat(np.arange(window), len(names))
+
+
+def lagged_items(flags, names, groups, dates, window):
+    """Sliding-window items: each row is one day's items next to those of the window-1 days before it.
+
+    Returns (flags, names, groups, lags). Rows exist only for days whose whole
+    window is present, so gaps in the history never pair non-adjacent days.
+    Lagged copies get a (group, lag) group, so rules linking one metric across
+    days are kept.
+    """
+    flags = np.asarray(flags, dtype=bool)
+    n_items = flags.shape[1]
+    days = np.array([date_to_day(d) for d in dates], dtype=np.int64)
+    if not len(days) or window < 2:
+        return flags, list(names), list(groups), np.zeros(n_items, dtype=np.int64)
+
+    # Lay days on a dense calendar grid, then stack shifted views of it
+    offsets = days - days.min()
+    span = int(offsets.max()) + 1
+    grid = np.zeros((span, n_items), dtype=bool)
+    present = np.zeros(span, dtype=bool)
+    grid[offsets] = flags
+    present[offsets] = True
+
+    rows = np.arange(window - 1, span)
+    valid = np.logical_and.reduce([present[rows - lag] for lag in range(window)])
+    matrix = np.hstack([grid[rows - lag] for lag in range(window)])[valid]
+
+    return (matrix, *lagged_vocabulary(names, groups, window))
+
+
+def temporal_rules(rules, lags):
+    """Keep rules whose antecedent is all earlier-day items and whose consequent is all same-day items."""
+    def lag_values(mask):
+        return [lags[i] for i in mask_items(mask)]
+    return [
+        rule for rule in rules
+        if all(lag > 0 for lag in lag_values(rule[0])) and all(lag == 0 for lag in lag_values(rule[1]))
+    ]
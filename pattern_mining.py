@@ -0,0 +1,191 @@
+"""Bitset frequent-itemset and association-rule engine for wellness patterns.
+
+Each day's boolean items are packed into one integer bitmask (item i -> bit i).
+For small item universes every itemset's support is counted at once: a
+histogram of day masks followed by a superset-sum transform over the 2^k
+masks. Larger universes fall back to level-wise Apriori where each
+candidate's support is one vectorized ``(masks & c) == c`` count.
+
+Long histories with many items go through ``fp_growth``: pattern growth over
+conditional databases, where each database is the distinct day masks with
+their day counts (the same prefix sharing an FP-tree gives, as arrays).
+
+Results follow mlxtend's apriori/association_rules semantics: itemsets with
+support >= min_support ordered by size then item order, and for each
+itemset, antecedents from largest to smallest in item order.
+"""
+from itertools import combinations
+
+import numpy as np
+
+# Up to this many items, count all 2^k itemsets with one superset-sum transform
+DENSE_MAX_ITEMS = 16
+MAX_ITEMS = 64
+CANDIDATE_CHUNK = 256
+
+
+def pack_transactions(flags):
+    """Pack an (n_days, n_items) boolean matrix into one uint64 bitmask per day."""
+    flags = np.asarray(flags, dtype=bool)
+    if flags.ndim != 2:
+        raise ValueError("Expected a 2-D (days x items) boolean matrix")
+    if flags.shape[1] > MAX_ITEMS:
+        raise ValueError(f"At most {MAX_ITEMS} items can be packed, got {flags.shape[1]}")
+    weights = np.left_shift(np.uint64(1), np.arange(flags.shape[1], dtype=np.uint64))
+    return (flags.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+
+
+def mask_items(mask):
+    """Item indices set in an itemset mask, ascending."""
+    mask = int(mask)
+    items = []
+    while mask:
+        low = mask & -mask
+        items.append(low.bit_length() - 1)
+        mask ^= low
+    return tuple(items)
+
+
+def items_mask(items):
+    mask = 0
+    for i in items:
+        mask |= 1 << i
+    return mask
+
+
+def _superset_counts(masks, n_items):
+    """counts[S] = number of days whose mask contains itemset S, for all 2^k itemsets."""
+    counts = np.bincount(masks.astype(np.int64), minlength=1 << n_items).astype(np.int64)
+    for i in range(n_items):
+        view = counts.reshape(-1, 2, 1 << i)
+        view[:, 0, :] += view[:, 1, :]
+    return counts
+
+
+def _count_candidates(masks, candidates):
+    """Support counts for candidate itemset masks, vectorized over days."""
+    candidates = np.asarray(candidates, dtype=np.uint64)
+    counts = np.empty(len(candidates), dtype=np.int64)
+    for start in range(0, len(candidates), CANDIDATE_CHUNK):
+        chunk = candidates[start:start + CANDIDATE_CHUNK]
+        counts[start:start + CANDIDATE_CHUNK] = ((masks[:, None] & chunk[None, :]) == chunk[None, :]).sum(axis=0)
+    return counts
+
+
+def frequent_itemsets(masks, n_items, min_support, max_len=None):
+    """{itemset mask: support} for every itemset with support >= min_support, in apriori order."""
+    masks = np.asarray(masks, dtype=np.uint64)
+    n_days = len(masks)
+    if n_days == 0 or n_items == 0:
+        return {}
+    max_len = n_items if max_len is None else min(max_len, n_items)
+
+    if n_items <= DENSE_MAX_ITEMS:
+        supports = _superset_counts(masks, n_items) / n_days
+        found = [
+            (mask_items(s), s, supports[s]) for s in np.flatnonzero(supports >= min_support) if s
+        ]
+        found = [entry for entry in found if len(entry[0]) <= max_len]
+        found.sort(key=lambda entry: (len(entry[0]), entry[0]))
+        return {int(s): float(support) for _, s, support in found}
+
+    # Level-wise Apriori: extend frequent (k-1)-itemsets by one larger item
+    result = {}
+    level = []
+    item_supports = _count_candidates(masks, [1 << i for i in range(n_items)]) / n_days
+    for i in range(n_items):
+        if item_supports[i] >= min_support:
+            level.append((i,))
+            result[1 << i] = float(item_supports[i])
+
+    size = 1
+    while level and size < max_len:
+        frequent = set(level)
+        candidates = []
+        for items in level:
+            for j in range(items[-1] + 1, n_items):
+                candidate = items + (j,)
+                # Every (k-1)-subset must itself be frequent
+                if all(candidate[:k] + candidate[k + 1:] in frequent for k in range(len(candidate) - 1)):
+                    candidates.append(candidate)
+        if not candidates:
+            break
+        supports = _count_candidates(masks, [items_mask(c) for c in candidates]) / n_days
+        level = []
+        for candidate, support in zip(candidates, supports):
+            if support >= min_support:
+                level.append(candidate)
+                result[items_mask(candidate)] = float(support)
+        size += 1
+    return result
+
+
+def _weighted_unique(masks, weights):
+    """Collapse duplicate masks, summing their weights."""
+    unique, inverse = np.unique(masks, return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=weights, minlength=len(unique)).astype(np.int64)
+
+
+def fp_growth(masks, n_items, min_support, max_len=None):
+    """Same result as frequent_itemsets, mined depth-first over conditional databases.
+
+    Identical days collapse into one weighted row, and each conditional database
+    keeps only items after the conditioning item, so work tracks the number of
+    frequent itemsets rather than 2^n_items.
+    """
+    masks = np.asarray(masks, dtype=np.uint64)
+    n_days = len(masks)
+    if n_days == 0 or n_items == 0:
+        return {}
+    if n_items > MAX_ITEMS:
+        raise ValueError(f"At most {MAX_ITEMS} items are supported, got {n_items}")
+    max_len = n_items if max_len is None else min(max_len, n_items)
+    shifts = np.arange(n_items, dtype=np.uint64)
+    found = []
+
+    def grow(prefix, size, db_masks, db_weights):
+        # Per-item support within this conditional database
+        bits = ((db_masks[:, None] >> shifts) & np.uint64(1)).astype(np.int64)
+        supports = (db_weights @ bits) / n_days
+        frequent = np.flatnonzero(supports >= min_support)
+        for i in frequent:
+            itemset = prefix | (1 << int(i))
+            found.append((size + 1, itemset, float(supports[i])))
+            if size + 1 >= max_len:
+                continue
+            later = np.uint64(((1 << n_items) - 1) ^ ((1 << (int(i) + 1)) - 1))
+            rows = ((db_masks >> np.uint64(i)) & np.uint64(1)) == 1
+            projected = db_masks[rows] & later
+            keep = projected != 0
+            if keep.any():
+                grow(itemset, size + 1, *_weighted_unique(projected[keep], db_weights[rows][keep]))
+
+    grow(0, 0, *_weighted_unique(masks, np.ones(n_days, dtype=np.int64)))
+    found.sort(key=lambda entry: (entry[0], mask_items(entry[1])))
+    return {itemset: support for _, itemset, support in found}
+
+
+def association_rules(itemsets, min_lift=1.0):
+    """Rules (antecedent_mask, consequent_mask, support, confidence, lift) with lift >= min_lift."""
+    rules = []
+    for itemset, support in itemsets.items():
+        items = mask_items(itemset)
+        if len(items) < 2:
+            continue
+        for size in range(len(items) - 1, 0, -1):
+            for antecedent_items in combinations(items, size):
+                antecedent = items_mask(antecedent_items)
+                consequent = itemset ^ antecedent
+                confidence = support / itemsets[antecedent]
+                lift = confidence / itemsets[consequent]
+                if lift >= min_lift:
+                    rules.append((antecedent, consequent, support, confidence, lift))
+    return rules
+
+
+def top_rules(rules, k):
+    """The k strongest rules by lift, then confidence, then support, kept in their original order."""
+    if k is None or len(rules) <= k:
+        return rules
+    ranked = sorted(range(len(rules)), key=lambda i: (rules[i][4], rules[i][3], rules[i][2]), reverse=True)
+    return [rules[i] for i in sorted(ranked[:k])]
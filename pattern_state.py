@@ -0,0 +1,286 @@
+"""Persistent, incrementally maintained itemset counts for wellness pattern mining.
+
+A PatternState holds, for one user and one mining mode, the item mask of every
+day it has seen and the support count of every itemset of up to ``max_len``
+items over its transactions (single days, or k-day windows in temporal mode).
+Adding, removing or correcting a day only touches the transactions containing
+that day, at O(2^items-in-transaction) each, and frequent itemsets are read
+straight off the counts without rescanning the history. Each day also keeps a
+fingerprint of the values its items are derived from, so a sync only itemizes
+the days whose inputs changed, and a sync that changes nothing is not saved.
+
+The itemization (goal thresholds, quantile bin edges, item vocabulary) is
+frozen when a state is built. New goals or a new config rebuild it, as does an
+item outside the frozen vocabulary or a history that has doubled or halved
+since the bin edges were taken.
+"""
+import os
+import pickle
+import tempfile
+import threading
+from itertools import combinations
+
+import numpy as np
+
+from metrics_store import GOAL_METRICS, USER_PATTERN, date_to_day, file_lock, file_signature, goal_thresholds
+from pattern_items import history_bin_edges, itemize, lagged_items, lagged_vocabulary
+from pattern_mining import MAX_ITEMS, mask_items, pack_transactions
+
+
+class ItemsetCounts:
+    """Support count of every itemset of up to max_len items over a multiset of transaction masks."""
+
+    def __init__(self, max_len):
+        self.max_len = max_len
+        self.counts = {}
+        self.n_transactions = 0
+
+    def update(self, mask, weight=1):
+        """Add (weight > 0) or remove (weight < 0) one transaction."""
+        bits = [1 << i for i in mask_items(mask)]
+        counts = self.counts
+        for size in range(1, min(self.max_len, len(bits)) + 1):
+            for subset in combinations(bits, size):
+                itemset = sum(subset)
+                count = counts.get(itemset, 0) + weight
+                if count:
+                    counts[itemset] = count
+                else:
+                    del counts[itemset]
+        self.n_transactions += weight
+
+    def frequent(self, min_support):
+        """{itemset mask: support} with support >= min_support, in apriori order."""
+        n = self.n_transactions
+        if not n:
+            return {}
+        found = [(mask_items(itemset), itemset, count / n)
+                 for itemset, count in self.counts.items() if count / n >= min_support]
+        found.sort(key=lambda entry: (len(entry[0]), entry[0]))
+        return {itemset: support for _, itemset, support in found}
+
+
+class PatternState:
+    """Frozen itemization plus day masks and itemset counts for one user and mode."""
+
+    def __init__(self, goals, config, window=1, max_len=3):
+        self.thresholds = goal_thresholds(goals)
+        self.goals = dict(goals)
+        self.config = config
+        self.window = window
+        self.max_len = max_len
+        self.bin_edges = {}
+        self.names = []
+        self.groups = []
+        self.day_masks = {}
+        self.day_inputs = {}
+        self.counts = ItemsetCounts(max_len)
+        self.built_days = 0
+
+    def matches(self, goals, config, window, max_len):
+        return (np.array_equal(self.thresholds, goal_thresholds(goals)) and self.config == config
+                and self.window == window and self.max_len == max_len)
+
+    def vocabulary(self):
+        """(item names, groups, lags) of the transaction columns."""
+        return lagged_vocabulary(self.names, self.groups, self.window)
+
+    def _input_keys(self):
+        """Record keys the itemization reads, besides the date."""
+        keys = set(GOAL_METRICS) if self.config.get('goals') else set()
+        keys.update(self.config.get('quantile_bins') or {})
+        if self.config.get('bmi_bands'):
+            keys.add('bmi')
+        return sorted(keys)
+
+    def _day_inputs(self, records, predictions):
+        """{date: (record, fingerprint of everything the day's items are derived from)}."""
+        keys = self._input_keys()
+        uses_predictions = bool(predictions) and (self.config.get('wellness_category') or self.config.get('at_risk'))
+        by_date = {p['date']: p for p in predictions} if uses_predictions else {}
+        inputs = {}
+        for record in records:
+            p = by_date.get(record['date'])
+            prediction = (p['wellness_category'], bool(p.get('is_at_risk'))) if p else None
+            inputs[record['date']] = (record, (tuple(record.get(key, 0) for key in keys), prediction))
+        return inputs
+
+    def build(self, records, predictions=None):
+        """Freeze the itemization on ``records`` and count every transaction from scratch."""
+        self.bin_edges = history_bin_edges(records, self.config)
+        flags, self.names, self.groups = itemize(
+            records, self.goals, predictions, self.config, bin_edges=self.bin_edges, drop_empty=False
+        )
+        if len(self.names) * self.window > MAX_ITEMS:
+            raise ValueError(f"{len(self.names)} items x {self.window}-day window exceeds {MAX_ITEMS} items")
+        dates = [record['date'] for record in records]
+        self.day_masks = dict(zip((date_to_day(d) for d in dates), map(int, pack_transactions(flags))))
+        self.day_inputs = {date: fingerprint for date, (_, fingerprint) in self._day_inputs(records, predictions).items()}
+        if self.window > 1:
+            flags = lagged_items(flags, self.names, self.groups, dates, self.window)[0]
+
+        # Identical transactions are counted once, with their multiplicity
+        self.counts = ItemsetCounts(self.max_len)
+        unique, weights = np.unique(pack_transactions(flags), return_counts=True)
+        for mask, weight in zip(unique, weights):
+            self.counts.update(int(mask), int(weight))
+        self.built_days = len(self.day_masks)
+
+    def _itemize_days(self, records, predictions):
+        """{day: mask} in the frozen vocabulary, or None if an unknown item occurs."""
+        flags, names, _ = itemize(
+            records, self.goals, predictions, self.config, bin_edges=self.bin_edges, drop_empty=False
+        )
+        index = {name: i for i, name in enumerate(self.names)}
+        matrix = np.zeros((len(records), len(self.names)), dtype=bool)
+        for j, name in enumerate(names):
+            if name in index:
+                matrix[:, index[name]] = flags[:, j]
+            elif flags[:, j].any():
+                return None
+        days = (date_to_day(record['date']) for record in records)
+        return dict(zip(days, map(int, pack_transactions(matrix))))
+
+    def _row_mask(self, day):
+        """Transaction mask of the window ending on ``day``, or None if the window has a gap."""
+        width = len(self.names)
+        mask = 0
+        for lag in range(self.window):
+            day_mask = self.day_masks.get(day - lag)
+            if day_mask is None:
+                return None
+            mask |= day_mask << (lag * width)
+        return mask
+
+    def _apply(self, changes):
+        """Apply {day: new mask, or None to remove}, re-counting only the windows that contain those days."""
+        affected = {day + lag for day in changes for lag in range(self.window)}
+        for day in affected:
+            mask = self._row_mask(day)
+            if mask is not None:
+                self.counts.update(mask, -1)
+        for day, mask in changes.items():
+            if mask is None:
+                self.day_masks.pop(day, None)
+            else:
+                self.day_masks[day] = mask
+        for day in affected:
+            mask = self._row_mask(day)
+            if mask is not None:
+                self.counts.update(mask, 1)
+
+    def upsert(self, records, predictions=None):
+        """Add or correct days. Returns False when the frozen itemization can't hold them."""
+        masks = self._itemize_days(records, predictions)
+        if masks is None:
+            return False
+        self._apply({day: mask for day, mask in masks.items() if self.day_masks.get(day) != mask})
+        for date, (_, fingerprint) in self._day_inputs(records, predictions).items():
+            self.day_inputs[date] = fingerprint
+        return True
+
+    def remove(self, dates):
+        self._apply({date_to_day(d): None for d in dates if date_to_day(d) in self.day_masks})
+        for date in dates:
+            self.day_inputs.pop(date, None)
+
+    def sync(self, records, predictions=None):
+        """Make the state cover exactly ``records``.
+
+        Only days whose inputs changed are itemized and re-counted. Returns the
+        number of days added, changed or removed, or None when the state should
+        be rebuilt instead.
+        """
+        n_days = len(records)
+        if n_days > 2 * self.built_days or 2 * n_days < self.built_days:
+            return None
+        inputs = self._day_inputs(records, predictions)
+        changed = [record for date, (record, fingerprint) in inputs.items() if self.day_inputs.get(date) != fingerprint]
+        removed = [date for date in self.day_inputs if date not in inputs]
+        if changed and not self.upsert(changed, predictions):
+            return None
+        if removed:
+            self.remove(removed)
+        return len(changed) + len(removed)
+
+    def transactions(self):
+        """Current transaction masks, one per complete window."""
+        masks = (self._row_mask(day) for day in sorted(self.day_masks))
+        return [mask for mask in masks if mask is not None]
+
+    def frequent_itemsets(self, min_support):
+        return self.counts.frequent(min_support)
+
+
+class PatternStateStore:
+    """PatternStates per (user, mode), cached in memory and pickled to one file each.
+
+    Cached states are re-read when their file changes on disk, and mine() holds
+    a file lock per (user, mode), so processes sharing the directory see each
+    other's updates.
+    """
+
+    def __init__(self, directory='pattern_state'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # (user, mode) -> (file signature, state)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _path(self, user_id, mode, suffix='.pkl'):
+        if not USER_PATTERN.match(user_id) or not USER_PATTERN.match(mode):
+            raise ValueError(f"Invalid user id or mode: {user_id!r}, {mode!r}")
+        return os.path.join(self.directory, f"{user_id}.{mode}{suffix}")
+
+    def _load(self, user_id, mode):
+        key = (user_id, mode)
+        path = self._path(user_id, mode)
+        signature = file_signature(path)
+        cached = self._states.get(key)
+        if cached is None or cached[0] != signature:
+            state = None
+            if signature is not None:
+                try:
+                    with open(path, 'rb') as f:
+                        state = pickle.load(f)
+                except Exception as e:
+                    print(f"⚠️ Discarding unreadable pattern state {path}: {e}")
+            self._states[key] = cached = (signature, state)
+        return cached[1]
+
+    def _save(self, user_id, mode, state):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(user_id, mode))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._states[(user_id, mode)] = (file_signature(self._path(user_id, mode)), state)
+
+    def mine(self, user_id, mode, records, predictions, goals, config, min_support, window=1, max_len=3):
+        """Bring the user's state up to date with ``records`` and return (itemsets, names, groups, lags)."""
+        with self._lock, file_lock(self._path(user_id, mode, '.lock')):
+            state = self._load(user_id, mode)
+            changed = None
+            if state is not None and hasattr(state, 'day_inputs') and state.matches(goals, config, window, max_len):
+                changed = state.sync(records, predictions)
+            if changed is None:
+                state = PatternState(goals, config, window, max_len)
+                state.build(records, predictions)
+                print(f"  🧮 Pattern state ({mode}): rebuilt from {len(records)} days")
+                self._save(user_id, mode, state)
+            elif changed:
+                print(f"  🧮 Pattern state ({mode}): updated {changed} day(s) incrementally")
+                self._save(user_id, mode, state)
+            return (state.frequent_itemsets(min_support), *state.vocabulary())
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for (user, mode) in [key for key in self._states if key[0] == user_id]:
+                self._states.pop((user, mode), None)
+            for name in os.listdir(self.directory):
+                # <user_id>.<mode>.pkl; user ids may themselves contain dots
+                if name.endswith('.pkl') and name[:-4].rsplit('.', 1)[0] == user_id:
+                    os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,259 @@
+"""Declarative recommendation rules, evaluated over many days at once.
+
+The rule table (recommendation_rules.json) is a list of groups. Within a group
+the first rule whose condition holds wins, like an if/elif chain, and each
+group contributes at most one message per day. Conditions are compiled once
+per table into functions that return NumPy masks over every day at once; each
+selected message is formatted once per distinct set of field values.
+HotReloadingRuleTable re-reads the file whenever its mtime changes.
+"""
+import json
+import operator
+import os
+import string
+import threading
+from itertools import repeat
+
+import numpy as np
+
+from caching import LRUCache
+
+METRICS = ('steps', 'active_minutes', 'sleep_minutes', 'calories')
+
+COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+FIELD_OPS = ('ratio', 'difference', 'scale')
+
+
+def goal_values(goals):
+    """Goal per metric, in the metric's own unit (sleep goal in minutes)."""
+    return {
+        'steps': goals.get('steps', 10000),
+        'active_minutes': goals.get('active_minutes', 60),
+        'sleep_minutes': goals.get('sleep_hours', 7.5) * 60,
+        'calories': goals.get('calories', 2500)
+    }
+
+
+class RuleTable:
+    """A compiled rule table: derived fields, rule groups, separator and fallback text."""
+
+    def __init__(self, spec):
+        self.separator = spec.get('separator', ' | ')
+        self.fallback = spec.get('fallback', '')
+        self.fields = spec.get('fields', {})
+        rules = [
+            [(rule['when'], *self._positional_template(rule['message'])) for rule in group['rules']]
+            for group in spec['groups']
+        ]
+        for name, field in self.fields.items():
+            if field.get('op') not in FIELD_OPS:
+                raise ValueError(f"Unknown op for field {name}: {field.get('op')}")
+            if field.get('of', 'steps') not in METRICS or field.get('goal', 'steps') not in METRICS:
+                raise ValueError(f"Unknown metric for field {name}: {field}")
+        # Category names in conditions are compared as small integer codes
+        self.category_codes = {}
+        for group in rules:
+            for condition, _, names in group:
+                self._check_condition(condition)
+                for name in names:
+                    is_goal = name.startswith('goal_') and name[len('goal_'):] in METRICS
+                    if name not in self.fields and name not in METRICS and not is_goal:
+                        raise ValueError(f"Unknown template field: {name}")
+        # A goal of zero (or less) means the metric has no goal: rules that compare against it
+        # or put it in their message don't fire, rather than reporting inf%/NaN% of nothing
+        self.groups = [
+            [(self._compile_mask(condition), template, names, self._rule_goals(condition, names))
+             for condition, template, names in group]
+            for group in rules
+        ]
+        self._goal_contexts = LRUCache(maxsize=64)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _positional_template(template):
+        """(template with named fields turned positional, field names), so it formats with format(*row)."""
+        names = sorted({name for _, name, _, _ in string.Formatter().parse(template) if name})
+        pieces = []
+        for literal, name, spec, conversion in string.Formatter().parse(template):
+            pieces.append(literal.replace('{', '{{').replace('}', '}}'))
+            if name is not None:
+                pieces.append('{' + str(names.index(name)) + (f'!{conversion}' if conversion else '')
+                              + (f':{spec}' if spec else '') + '}')
+        return ''.join(pieces), names
+
+    def _check_condition(self, condition):
+        if 'any' in condition or 'all' in condition:
+            for part in condition.get('any', condition.get('all')):
+                self._check_condition(part)
+        elif 'metric' in condition:
+            if condition['metric'] not in METRICS or condition['op'] not in COMPARISONS:
+                raise ValueError(f"Invalid metric condition: {condition}")
+            if 'goal' in condition and condition['goal'] not in METRICS:
+                raise ValueError(f"Invalid goal in condition: {condition}")
+        elif 'category' in condition:
+            self.category_codes.setdefault(condition['category'], len(self.category_codes))
+        elif condition.get('flag') != 'is_at_risk':
+            raise ValueError(f"Invalid condition: {condition}")
+
+    def _condition_goals(self, condition):
+        if 'any' in condition or 'all' in condition:
+            return set().union(*[self._condition_goals(c) for c in condition.get('any', condition.get('all'))])
+        return {condition['goal']} if 'goal' in condition else set()
+
+    def _rule_goals(self, condition, names):
+        """Goals a rule depends on, through its condition or its message fields."""
+        goals = self._condition_goals(condition)
+        for name in names:
+            if name in self.fields:
+                goals.add(self.fields[name].get('goal'))
+            elif name not in METRICS:
+                goals.add(name[len('goal_'):])
+        goals.discard(None)
+        return tuple(sorted(goals))
+
+    def _compile_mask(self, condition):
+        """mask(values, goals, category_codes, at_risk) -> boolean array, for a validated condition."""
+        if 'any' in condition or 'all' in condition:
+            parts = [self._compile_mask(c) for c in condition.get('any', condition.get('all'))]
+            combine = np.logical_or if 'any' in condition else np.logical_and
+            return lambda *days: combine.reduce([part(*days) for part in parts])
+        if 'category' in condition:
+            code = self.category_codes[condition['category']]
+            return lambda values, goals, category_codes, at_risk: category_codes == code
+        if 'flag' in condition:
+            return lambda values, goals, category_codes, at_risk: at_risk
+        compare, metric = COMPARISONS[condition['op']], condition['metric']
+        if 'goal' not in condition:
+            threshold = condition['value']
+            return lambda values, goals, *_: compare(values[metric], threshold)
+        goal = condition['goal']
+        if 'factor' in condition:
+            factor = condition['factor']
+            return lambda values, goals, *_: compare(values[metric], goals[goal] * factor)
+        return lambda values, goals, *_: compare(values[metric], goals[goal])
+
+    def _field(self, spec, values, goals):
+        """Derived template field, computed with the same operation order as the original f-strings."""
+        source = values[spec['of']] if 'of' in spec else goals[spec['goal']]
+        if spec['op'] == 'ratio':
+            result = source / goals[spec['goal']] * spec.get('factor', 1)
+        elif spec['op'] == 'difference':
+            result = goals[spec['goal']] - values[spec['of']]
+        else:
+            result = source * spec['factor'] if 'factor' in spec else source / spec.get('divisor', 1)
+        if spec.get('int'):
+            result = np.trunc(result).astype(np.int64)
+        return result
+
+    def _goal_context(self, goals):
+        """(rules enabled per group, goal-only template fields as scalars) for one set of goals, cached."""
+        key = tuple(goals[metric] for metric in METRICS)
+        context = self._goal_contexts.get(key)
+        if context is None:
+            enabled = [[all(goals[goal] > 0 for goal in rule_goals) for _, _, _, rule_goals in group]
+                       for group in self.groups]
+            constants = {f'goal_{metric}': goals[metric] for metric in METRICS}
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for name, spec in self.fields.items():
+                    if 'of' not in spec:
+                        constants[name] = np.asarray(self._field(spec, {}, goals)).item()
+            context = (enabled, constants)
+            self._goal_contexts.put(key, context)
+        return context
+
+    def evaluate(self, records, categories, at_risk, goals):
+        """One recommendation string per record."""
+        n = len(records)
+        if not n:
+            return []
+        values = {metric: np.array([record.get(metric, 0) for record in records]) for metric in METRICS}
+        goals = goal_values(goals)
+        enabled, constants = self._goal_context(goals)
+        codes = self.category_codes
+        category_codes = np.array([codes.get(category, -1) for category in categories], dtype=np.int64)
+        at_risk = np.array(at_risk, dtype=bool)
+
+        # Per-day template fields as arrays, computed lazily for the templates actually used
+        field_cache = {}
+
+        def field(name):
+            if name not in field_cache:
+                field_cache[name] = values[name] if name in METRICS else self._field(self.fields[name], values, goals)
+            return field_cache[name]
+
+        messages = [[] for _ in range(n)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Winning rule per group and day, numbered across groups (-1: none). Later rules
+            # are applied first, so the first match wins
+            chosen = np.full((len(self.groups), n), -1, dtype=np.int64)
+            rule_id = 0
+            for winners, group, group_enabled in zip(chosen, self.groups, enabled):
+                for r in range(len(group) - 1, -1, -1):
+                    if group_enabled[r]:
+                        winners[group[r][0](values, goals, category_codes, at_risk)] = rule_id + r
+                rule_id += len(group)
+
+            # Days per rule from one stable sort, in group order so messages keep their order
+            flat = chosen.ravel()
+            by_rule = np.argsort(flat, kind='stable') % n
+            bounds = np.cumsum(np.bincount(flat + 1, minlength=rule_id + 1)).tolist()
+            for rule_id, (_, template, names, _) in enumerate(rule for group in self.groups for rule in group):
+                days = by_rule[bounds[rule_id]:bounds[rule_id + 1]]
+                if not len(days):
+                    continue
+                days_list = days.tolist()
+                if all(name in constants for name in names):
+                    text = template.format(*[constants[name] for name in names])
+                    for i in days_list:
+                        messages[i].append(text)
+                    continue
+                # Format once per distinct combination of field values
+                rows = list(zip(*[repeat(constants[name]) if name in constants else field(name)[days].tolist()
+                                  for name in names]))
+                texts = {row: template.format(*row) for row in set(rows)}
+                for i, row in zip(days_list, rows):
+                    messages[i].append(texts[row])
+        separator, fallback = self.separator, self.fallback
+        return [separator.join(parts) if parts else fallback for parts in messages]
+
+
+class HotReloadingRuleTable:
+    """RuleTable backed by a file, reloaded when the file changes. A broken edit keeps the last good table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self._table = RuleTable.from_file(path)
+
+    def current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"⚠️ Recommendation rules unavailable ({e}); keeping the loaded table")
+            return self._table
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._table = RuleTable.from_file(self.path)
+                        print(f"🔄 Reloaded recommendation rules from {self.path}")
+                    except Exception as e:
+                        print(f"❌ Invalid recommendation rules in {self.path}: {e}; keeping the previous table")
+                    self._mtime = mtime
+        return self._table
+
+    def evaluate(self, records, categories, at_risk, goals):
+        return self.current().evaluate(records, categories, at_risk, goals)
@@ -0,0 +1,292 @@
+"""Server-side Flask sessions.
+
+Only an opaque random session id travels in the cookie; the session payload
+(fitness history, predictions, patterns, goals) lives in a backend and is
+loaded one key at a time, so an endpoint that only needs ``user_goals`` never
+reads the fitness history.
+"""
+import os
+import pickle
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+
+SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{32,128}$')
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+class MemorySessionBackend:
+    """Process-local session storage. Sessions vanish on restart and aren't shared between workers."""
+
+    def __init__(self, ttl_seconds=31 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._sessions = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+
+    def _purge_expired(self, now):
+        expired = [sid for sid, touched in self._touched.items() if now - touched > self.ttl_seconds]
+        for sid in expired:
+            self._sessions.pop(sid, None)
+            self._touched.pop(sid, None)
+
+    def exists(self, sid):
+        with self._lock:
+            now = time.time()
+            self._purge_expired(now)
+            if sid not in self._sessions:
+                return False
+            self._touched[sid] = now
+            return True
+
+    def keys(self, sid):
+        with self._lock:
+            return list(self._sessions.get(sid, {}))
+
+    def get(self, sid, key):
+        with self._lock:
+            return self._sessions.get(sid, {})[key]
+
+    def set(self, sid, key, value):
+        with self._lock:
+            self._sessions.setdefault(sid, {})[key] = value
+            self._touched[sid] = time.time()
+
+    def delete(self, sid, key=None):
+        with self._lock:
+            if key is None:
+                self._sessions.pop(sid, None)
+                self._touched.pop(sid, None)
+            else:
+                self._sessions.get(sid, {}).pop(key, None)
+
+
+class FileSystemSessionBackend:
+    """One directory per session and one pickle file per key, written atomically.
+
+    The directory's mtime is the session's last use: it is bumped whenever the
+    session is opened or written. Sessions idle for longer than ``ttl_seconds``
+    are removed when they come back, and by a sweep of the whole directory that
+    runs on write at most every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, directory='flask_sessions', ttl_seconds=31 * 24 * 3600, sweep_interval=3600):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _session_dir(self, sid):
+        if not SID_PATTERN.match(sid):
+            raise KeyError(sid)
+        return os.path.join(self.directory, sid)
+
+    def _key_path(self, sid, key):
+        if not KEY_PATTERN.match(key):
+            raise KeyError(key)
+        return os.path.join(self._session_dir(sid), f"{key}.pkl")
+
+    def exists(self, sid):
+        try:
+            path = self._session_dir(sid)
+        except KeyError:
+            return False
+        if not os.path.isdir(path):
+            return False
+        if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+            self.delete(sid)
+            return False
+        # Opening a session counts as use, so sessions that are only read don't expire as idle
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def sweep(self, now=None):
+        """Remove every session directory idle for longer than ttl_seconds. Returns how many were removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if not SID_PATTERN.match(entry.name):
+                continue
+            try:
+                if not entry.is_dir() or now - entry.stat().st_mtime <= self.ttl_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def _sweep_if_due(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            removed = self.sweep(now)
+        finally:
+            self._sweep_lock.release()
+        if removed:
+            print(f"🧹 Removed {removed} expired session(s) from {self.directory}")
+
+    def keys(self, sid):
+        try:
+            names = os.listdir(self._session_dir(sid))
+        except (KeyError, FileNotFoundError):
+            return []
+        return [name[:-4] for name in names if name.endswith('.pkl')]
+
+    def get(self, sid, key):
+        try:
+            with open(self._key_path(sid, key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def set(self, sid, key, value):
+        path = self._key_path(sid, key)
+        session_dir = os.path.dirname(path)
+        os.makedirs(session_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # Directory mtime doubles as the session's last-use time for expiry
+        os.utime(session_dir)
+        self._sweep_if_due()
+
+    def delete(self, sid, key=None):
+        try:
+            if key is None:
+                shutil.rmtree(self._session_dir(sid), ignore_errors=True)
+            else:
+                os.remove(self._key_path(sid, key))
+        except (KeyError, FileNotFoundError):
+            pass
+
+
+class ServerSideSession(SessionMixin):
+    """Session whose values are fetched from the backend lazily, key by key."""
+
+    def __init__(self, backend, sid, new=False):
+        self.backend = backend
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self._cache = {}
+        self._dirty = set()
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        self.accessed = True
+        if key in self._deleted:
+            raise KeyError(key)
+        if key not in self._cache:
+            if self.new:
+                raise KeyError(key)
+            self._cache[key] = self.backend.get(self.sid, key)
+        return self._cache[key]
+
+    def __setitem__(self, key, value):
+        self.accessed = True
+        self._cache[key] = value
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        self.modified = True
+
+    def __delitem__(self, key):
+        self[key]  # raise KeyError for missing keys, like a dict
+        self._cache.pop(key, None)
+        self._dirty.discard(key)
+        self._deleted.add(key)
+        self.modified = True
+
+    def __iter__(self):
+        self.accessed = True
+        stored = [] if self.new else self.backend.keys(self.sid)
+        keys = (set(stored) | set(self._cache)) - self._deleted
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def flush(self):
+        """Write changed keys to the backend and drop deleted ones."""
+        for key in self._deleted:
+            self.backend.delete(self.sid, key)
+        for key in self._dirty:
+            self.backend.set(self.sid, key, self._cache[key])
+        self._deleted.clear()
+        self._dirty.clear()
+        self.new = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps an opaque session id in the cookie and the payload in ``backend``."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and self.backend.exists(sid):
+            return ServerSideSession(self.backend, sid)
+        return ServerSideSession(self.backend, secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            return
+
+        session.flush()
+        if not len(session):
+            self.backend.delete(session.sid)
+            response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def make_session_backend(kind='filesystem', directory='flask_sessions'):
+    """Build a session backend by name ("filesystem" or "memory")."""
+    if kind == 'memory':
+        return MemorySessionBackend()
+    if kind == 'filesystem':
+        return FileSystemSessionBackend(directory)
+    raise ValueError(f"Unknown session backend: {kind}")
@@ -0,0 +1,89 @@
+"""Compact columnar wire format and response compression for the dashboard payload.
+
+The legacy /api/dashboard-data response repeats every daily value in
+``chart_data``, ``raw_data`` and ``predictions``. The columnar format (version
+3) sends one set of metric columns, prediction columns that point back into
+them by row, and each distinct recommendation message once. A day's
+recommendation text is a list of indexes into those messages: whole strings
+embed per-day numbers and are nearly all distinct, the messages they are
+joined from mostly aren't.
+"""
+import gzip
+import zlib
+
+from metrics_store import METRIC_COLUMNS, day_to_date
+
+COLUMNAR_FORMAT_VERSION = 3
+COMPRESSION_MIN_BYTES = 1024
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+
+def encode_columnar_dashboard(columns, predictions, summary, patterns, separator=' | '):
+    """Build the version-3 columnar dashboard payload.
+
+    ``separator`` is the one recommendation messages are joined with; the client
+    joins the listed messages with it again.
+    """
+    dates = [day_to_date(day) for day in columns['day']]
+    row_by_date = {date_str: i for i, date_str in enumerate(dates)}
+
+    categories = []
+    category_index = {}
+    messages = []
+    message_index = {}
+    prediction_columns = {
+        'row': [],
+        'wellness_category': [],
+        'risk_probability': [],
+        'is_at_risk': [],
+        'predicted_calories': [],
+        'recommendations': []
+    }
+    for p in predictions or []:
+        row = row_by_date.get(p['date'])
+        if row is None:
+            continue
+        category = p['wellness_category']
+        if category not in category_index:
+            category_index[category] = len(categories)
+            categories.append(category)
+        parts = []
+        for message in p.get('recommendations', '').split(separator):
+            if message not in message_index:
+                message_index[message] = len(messages)
+                messages.append(message)
+            parts.append(message_index[message])
+
+        prediction_columns['row'].append(row)
+        prediction_columns['wellness_category'].append(category_index[category])
+        prediction_columns['risk_probability'].append(p['risk_probability'])
+        prediction_columns['is_at_risk'].append(int(p['is_at_risk']))
+        prediction_columns['predicted_calories'].append(p['predicted_calories'])
+        prediction_columns['recommendations'].append(parts)
+
+    return {
+        'format': 'columnar',
+        'version': COLUMNAR_FORMAT_VERSION,
+        'columns': {'date': dates, **{name: columns[name].tolist() for name in METRIC_COLUMNS}},
+        'predictions': prediction_columns,
+        'categories': categories,
+        'recommendation_messages': messages,
+        'recommendation_separator': separator,
+        'summary': summary,
+        'wellness_patterns': patterns
+    }
+
+
+def choose_content_encoding(accept_encodings):
+    """Best supported Content-Encoding from a werkzeug Accept-Encoding header, or None."""
+    return accept_encodings.best_match(SUPPORTED_ENCODINGS)
+
+
+def compress_body(body, encoding, level=6):
+    """Compress a response body for the given Content-Encoding."""
+    if encoding == 'gzip':
+        # Fixed mtime keeps the output (and its ETag) deterministic
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(body, level)
+    raise ValueError(f"Unsupported content encoding: {encoding}")